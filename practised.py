@@ -30,31 +30,18 @@ import os
 import pathlib
 import glob
 import sys
-
-from PIL import Image, ImageTk
-
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-from openpyxl import load_workbook
-from openpyxl import Workbook
-from openpyxl.utils import FORMULAE
-from openpyxl.utils import get_column_letter, column_index_from_string
-import math
-from scipy.optimize import curve_fit
-from scipy import interpolate
-from datetime import date
 import time
+
+# The stages (and with them pandas, matplotlib, scipy, openpyxl, fpdf and PIL) are imported when they are first used,
+# so that the window opens without loading them
 from natsort import natsorted
-from fpdf import FPDF
-import webbrowser
-from practised_working import workingfileprep
-from practised_analysis import dataanalysis
-from practised_compensation import compensate
-from practised_pdfReport import report
+import practised_loader
+from practised_store import openWorkingData, isStore, readOutputs
 from practised_validate import *
-from practised_knuteon import *
-import practised_pwexplode 
+import practised_notify
+
+# Warnings and errors of the stages are shown as popups
+practised_notify.guiMode = True
 
 sg.theme('DarkBlue3')
 
@@ -116,7 +103,7 @@ inputCol = [
 
 # Builing output column for GUI        
 outputCol= [
-    [sg.Table(values=[],headings=['prACTISed output'], key='Kd', hide_vertical_scroll=True, def_col_width=20, auto_size_columns=False)],
+    [sg.Table(values=[],headings=['prACTISed output'], key='Kd', hide_vertical_scroll=True, def_col_width=34, auto_size_columns=False)],
 
     [sg.Table(values=[], headings=['Conc','Avg Sig (S)', 'S Std Dev', 'S Rel Std Dev', 'R value', 'R Std Dev', 'R Rel Std Dev'], key='summary', def_col_width=10,auto_size_columns=False)],
 
@@ -154,6 +141,8 @@ window = sg.Window("prACTISed", layout, finalize=True, element_justification='c'
 
 # Display image from file path - for GUI image viewer
 def load_image(path,window):
+    from PIL import Image, ImageTk
+
     img = Image.open(path)
     img.thumbnail((350,350))       # (420, 420) is same width as summary  table
     photo_img = ImageTk.PhotoImage(img)
@@ -215,7 +204,7 @@ while True:
             
         # Verify if input path is Excel workbook or directory
         elif os.path.exists(filePath):
-            if os.path.isfile(filePath) and filePath.endswith(".xlsx"):
+            if (os.path.isfile(filePath) and filePath.endswith(".xlsx")) or isStore(filePath):
                 window['in'].update(visible=False)
                 window['calculate'].update(disabled=False)
 
@@ -263,8 +252,7 @@ while True:
  
                     window2['loadText'].update('Reading input Excel file...')
                     window2['progressBar'].UpdateBar(2)
-                    data = pd.read_excel(workingFile, engine='openpyxl')
-                    inputBook = load_workbook(workingFile, data_only=True)         
+                    inputBook = openWorkingData(workingFile).book
                     idealSheet = inputBook["Inputs"]
                     compYN = str(idealSheet.cell(13,2).value)
                 
@@ -355,9 +343,12 @@ while True:
                 # Prepare working file
                 window2['loadText'].update('Preparing working file...')
                 window2['progressBar'].UpdateBar(3)
+                from practised_working import workingfileprep
+                from practised_scan import manifestArguments
                 workingFile = workingfileprep(filePath, workingFilePath, propFlow, injectFlow, injectTime, sepLength, sepDiam,
                                               injectLength, injectDiam, proteinName, ligandName, ligandConc, dataType,
-                                              compYN, normalConc, windowWidth, peakDet, manualPeaks, peakConc)
+                                              compYN, normalConc, windowWidth, peakDet, manualPeaks, peakConc,
+                                              **manifestArguments(workingfileprep, checkDirect[3]))
 
                 
         # Unmask signals with compensation procedure if indicated
@@ -367,6 +358,7 @@ while True:
                 window2['loadText'].update('Compensating data...')
                 window2['progressBar'].UpdateBar(4)
     
+                from practised_compensation import compensate
                 if compensate(workingFile) == False:
                     window2.close()
                     valid = False
@@ -377,6 +369,7 @@ while True:
             window2['loadText'].update('Analyzing data...')
             window2['progressBar'].UpdateBar(5)
 
+            from practised_analysis import dataanalysis
             graphPath = dataanalysis(workingFile)
             if graphPath == False:
                 window2.close()
@@ -391,16 +384,13 @@ while True:
             load_image(images[0],window)
                 
             # Read in summary and Kd information from working file to display in GUI output
-            df = pd.read_excel(workingFile, sheet_name=-1, header=None, usecols="D:J", engine='openpyxl')
-            df = df.dropna(how='all')
-            headers = df.iloc[0].values.tolist()
-            data = df.iloc[1:].values.tolist()
+            outputs = readOutputs(workingFile)
+            headers = outputs['summary'][0]
+            data = outputs['summary'][1:]
             window['summary'].update(values=data, num_rows=min(10,len(data)))
 
-            df = pd.read_excel(workingFile, sheet_name=-1, header=None, usecols="L", engine='openpyxl')
-            df = df.dropna(how='all')
-            data = df.values.tolist()
-            window['Kd'].update(values=data, num_rows=3)
+            data = outputs['kd']
+            window['Kd'].update(values=data, num_rows=len(data))
             window2['loadText'].update('prACTISed complete!')
             window2['progressBar'].UpdateBar(10)
             
@@ -427,6 +417,7 @@ while True:
 
     # Functionality for report button to generate, save and open PDF report
     if event == 'report':
+        from practised_pdfReport import report
         report(workingFile, graphPath) 
 
 window.close()
@@ -21,36 +21,106 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-def dataanalysis(fileName):
+# Window averaging for all runs of one concentration at once. time is the shared raw time axis (ascending) and signals
+# a 2-D array (time x runs). Injection and window bounds are looked up in the concentration's time index (built here
+# if none is given, see practised_peaks.TimeIndex); background, window means and replicate statistics are reductions
+# over the whole array (NaN, e.g. from shorter runs, is skipped per run). Returns None if percentage is 0 and there is
+# no time within 0.5 s of the peak time
+def windowAverages(time, signals, injectionTime, peakTime, percentage, timeIndex=None):
+        import numpy as np
+        from practised_peaks import TimeIndex
+
+        if timeIndex is None:
+                timeIndex = TimeIndex(time, injectionTime)
+        signals = np.asarray(signals, dtype=float).reshape(len(timeIndex.time), -1)
+
+        # All values before the injection time are background signal, the rest is converted to propagation time
+        injection = timeIndex.injection
+        propTime = timeIndex.propagation
+        propSignals = signals[injection:]
+
+        windowLow = float(peakTime - (percentage * peakTime))
+        windowHigh = float(peakTime + (percentage * peakTime))
+
+        bounds = timeIndex.window(peakTime, percentage)
+        if bounds is None:
+                return None
+        low, high = bounds
+
+        # Mean and population standard deviation of each run; runs are made contiguous rows so that the sums are the
+        # same (pairwise) sums as for a single column
+        def nanMeanStd(values):
+                values = np.ascontiguousarray(values.T)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                        count = np.sum(~np.isnan(values), axis=1)
+                        mean = np.nansum(values, axis=1) / count
+                        std = np.sqrt(np.nansum((values - mean[:,None])**2, axis=1) / count)
+                return mean, std
+
+        backgroundMeans, backgroundStd = nanMeanStd(signals[:injection])
+        runMeans = nanMeanStd(propSignals[low:high])[0]
+
+        return {'propagation time': propTime, 'propagation signals': propSignals, 'window low': windowLow,
+                'window high': windowHigh, 'background mean': backgroundMeans, 'background std': backgroundStd,
+                'run means': runMeans, 'mean': np.mean(runMeans), 'std': np.std(runMeans)}
+
+
+# R values and their standard deviations for the average signals (and standard deviations) of the concentrations from
+# index first on; lower concentrations are not used. R is 1 at concentration first and 0 at the highest concentration.
+# The signals of a concentration can also be arrays (e.g. of resamples)
+def rValues(signal, stddev, first):
+        import numpy as np
+
+        LowProt_sig = signal[first]
+        HighProt_sig = signal[len(signal)-1]
+        LowProt_stddev = stddev[first]
+        HighProt_stdDev = stddev[len(signal)-1]
+
+        Rvalue = []
+        Rstddev = []
+        for y in range(first, len(signal)):
+                Rvalue.append((signal[y] - HighProt_sig)/ (LowProt_sig - HighProt_sig))
+                Rstddev.append( 1/(LowProt_sig - HighProt_sig) * np.sqrt( (stddev[y]**2) + ((signal[y] - LowProt_sig)/ (LowProt_sig - HighProt_sig) * HighProt_stdDev)**2 +
+                                                                            ((HighProt_sig - signal[y])/(LowProt_sig - HighProt_sig) * LowProt_stddev)**2))
+        return Rvalue, Rstddev
+
+
+# With returnResults the Kd, its error, unit, R² and χ² are returned together with the graph folder. graphMode "on"
+# renders the graphs (in graphWorkers processes, see practised_graphs.renderGraphs), "off" skips them (no graph folder
+# is made, None is returned for it) and "defer" saves them in the graph folder to be rendered later with
+# practised_graphs.renderDeferred. With weighted the binding isotherm fit is weighted by the R standard deviations. A
+# confidence interval of Kd is calculated by refitting resamples of resampled runs ("runs") or R values ("R"), see
+# practised_bootstrap.bootstrapKd; 0 resamples skips it. peakFinder selects how the peak is determined programmatically:
+# "maximum" (highest signal of run 1) or "smoothed" (median of the most prominent peaks of the smoothed runs), see
+# practised_peaks.referencePeakTime
+def dataanalysis(fileName, returnResults=False, graphMode="on", graphWorkers=1, weighted=False, resamples=10000,
+                 resampling="runs", peakFinder="maximum"):
 
         ## Part 1 - Importing the required libraries and sub-libraries required below
-        import argparse                                   
         import pathlib
-        import sys
         import pandas as pd
-        import matplotlib.pyplot as plt
         import numpy as np
-        from openpyxl import load_workbook
-        from openpyxl import Workbook
-        from openpyxl.utils import FORMULAE
-        from openpyxl.utils import get_column_letter, column_index_from_string
-        import math
-        from scipy.optimize import curve_fit
-        from datetime import date
         import os
 
+        from practised_store import openWorkingData, isStore, writeFrame
+        from practised_graphs import renderGraphs, deferGraphs
+        from practised_fit import isotherm, fitIsotherm
+        from practised_bootstrap import bootstrapKd, methodNames
+        from practised_peaks import TimeIndex, referencePeakTime
+        import practised_notify
+
 
         ## Part 3 - Locating the raw data file and establishing important inputs                         
-        if not pathlib.Path(fileName).is_file():
-                print("Given file '%s' is not a file or does not exist." % fileName)
-                exit(-1)
+        if not pathlib.Path(fileName).is_file() and not isStore(fileName):
+                practised_notify.error("Given file '%s' is not a file or does not exist." % fileName)
+                return False
 
         name = pathlib.PurePath(fileName).name
 
-        # Set explicitly the engine to use openpyxl, otherwise it might use xlrd, which has removed support for Excel's xlsx format (only supports the old binary format)
-        data = pd.read_excel(fileName, engine='openpyxl')
-        inputBook = load_workbook(fileName, data_only=True)         
-        inputBooknames = inputBook.sheetnames
+        # Open the working file (.xlsx) or working store; Inputs/Outputs are worksheets, concentrations are read as data frames
+        workingData = openWorkingData(fileName)
+        inputBook = workingData.book
+        inputBooknames = workingData.sheetnames
 
 
         # Confirm Inputs sheet with correct formatting before preceding
@@ -66,21 +136,25 @@ def dataanalysis(fileName):
             peakDet = str(idealSheet.cell(16,2).value)
 
             
-            subdirect = "%s_graphs" % os.path.splitext(fileName)[0]
-            if os.path.exists(subdirect)== False:
-                    os.mkdir(subdirect)
-                    
-            elif os.path.exists(subdirect)== True:
-                    for duplicate in range(2,9):
-                            temp = "%s_%d" % (subdirect, duplicate)
-                            
-                            if os.path.exists(temp)== False:
-                                    subdirect=temp
-                                    os.mkdir(subdirect)
-                                    break
+            # No graph folder if the graphs are skipped
+            subdirect = None
+            if graphMode != "off":
+                subdirect = "%s_graphs" % os.path.splitext(fileName)[0]
+                if os.path.exists(subdirect)== False:
+                        os.mkdir(subdirect)
+                        
+                elif os.path.exists(subdirect)== True:
+                        for duplicate in range(2,9):
+                                temp = "%s_%d" % (subdirect, duplicate)
+                                
+                                if os.path.exists(temp)== False:
+                                        subdirect=temp
+                                        os.mkdir(subdirect)
+                                        break
             
         elif "Inputs" not in inputBook.sheetnames:  
-                sys.exit("Input file Formatting Error: The script expects inputdata.xlsx to be in a certain format, see provided idealinputs.xlsx as an example.") 
+                practised_notify.error("Input file Formatting Error: The script expects inputdata.xlsx to be in a certain format, see provided idealinputs.xlsx as an example.")
+                return False
 
         # Temporary variables
         concentration = []
@@ -90,29 +164,30 @@ def dataanalysis(fileName):
         Rvalue = []
         Rstddev = []
         relRstddev = []
+        runMeans = []
         graphs = []
         graphNames = []
         forDF = [concentration,signal,stddev,relstddev,Rvalue,Rstddev,relRstddev]
         DFnames = ["Conc","Avg Sig (S)","S Std Dev","S Rel Std Dev","R value","R Std Dev", "R Rel Std Dev"]
 
-        # If programmatic determination of peak use first run at specified concentration to calculate peak time and time window
+        # Read every concentration sheet once (without blank rows, i.e. that would produce "NaN"s); all passes below use this dataset
+        dataset = workingData.dataset([idealSheet.cell(x,5).value for x in range(1,int(numberOfConcs)+1)])
+
+        # Time index of every concentration (injection point, propagation time), used for all peak and window lookups
+        timeIndexes = dict((conc, TimeIndex(dataset[conc]['raw time'], injectionTime)) for conc in dataset)
+
+        # If programmatic determination of peak use the runs at specified concentration to calculate peak time and time window
         if peakDet == "P":
                 windowCalcConc = float(idealSheet.cell(18,2).value)
                 windowCalcConcS = "%s %s" % (windowCalcConc, idealSheet.cell(1,5).value.partition(" ")[2])
 
-                data = pd.read_excel(fileName, sheet_name=windowCalcConcS, engine='openpyxl')
-                data = data.dropna(how='all')
-                xvalues = data['raw time']
-                yvalues = data.iloc[:,1]
-
-                # Convert raw time to propagation time
-                yvalues = yvalues[xvalues >= injectionTime]
-                xvalues = xvalues[xvalues >= injectionTime]
-                xvalues = xvalues.subtract(injectionTime)
-
-                peakSignal = max(yvalues)
-                peakIndex = yvalues[yvalues == peakSignal].index
-                peakTime = float(xvalues[peakIndex])
+                if windowCalcConcS in dataset:
+                        data = dataset[windowCalcConcS]
+                        timeIndex = timeIndexes[windowCalcConcS]
+                else:
+                        data = workingData.sheet(windowCalcConcS).dropna(how='all')
+                        timeIndex = TimeIndex(data['raw time'], injectionTime)
+                peakTime = referencePeakTime(timeIndex, data.iloc[:,1:], peakFinder)
 
 
         # Determine absolute max signal value and max number of runs (used to set graph parameters)
@@ -121,8 +196,7 @@ def dataanalysis(fileName):
         manualPeaks = []
         for x in range(1,int(numberOfConcs)+1):         
                 conc1 = idealSheet.cell(x,5).value
-                data = pd.read_excel(fileName, sheet_name=conc1, engine='openpyxl')
-                data = data.dropna(how='all')
+                data = dataset[conc1]
                 data2 = data.iloc[:,1:]
                 currentMaxRuns = len(data2.columns)
                 colMax = data.max()
@@ -135,98 +209,56 @@ def dataanalysis(fileName):
 
                  # If manual determination, extract the manually set peak time for given concentrations
                 if peakDet == "M":
-                        xvalues = data.iloc[:,0]
                         manualTimes = idealSheet.cell(17,2).value.split(",")
-                        peakIndex = xvalues.searchsorted(float(manualTimes[x-1]), side='left')
-                        peakTime = xvalues[peakIndex-1]
-                        peakTime = peakTime
+                        peakTime = timeIndexes[conc1].rawTimeBefore(manualTimes[x-1])
                         manualPeaks.append(peakTime)
 
                         windowCalcConc = 1^-25
         
         ## Part 4 - Calculating signal information for each concentration and generating separagram graphs
+        yLabel = None
+        if dataType == "MS":
+                yLabel = 'MS intensity (a.u.)'
+        elif dataType == "F":
+                yLabel = 'Fluorescence (a.u.)'
+
         for x in range(1,numberOfConcs+1):         
             conc1 = idealSheet.cell(x,5).value
             
-            avgSigConc = 0
-            avgSigsRun = []
-
-
-            # Reading in the whole data frame (= all runs for one particular concentration) and dropping all lines that are blank, i.e. that would produce "NaN"s
-            data = pd.read_excel(fileName, sheet_name=conc1, engine='openpyxl')
-            data = data.dropna(how='all')
+            # The whole data frame (= all runs for one particular concentration)
+            data = dataset[conc1]
             numberOfRuns = len(data.columns)
+            minTime = data['raw time'].iloc[0]
 
+            if peakDet == "M":
+                    peakTime = manualPeaks[x-1]
 
-            # Calculate background signals for each run
-            for col in range(1, numberOfRuns):
-
-                runName = data.columns[col]
-
-                xvalues = data['raw time']
-                yvalues = data[runName]
-                minTime = xvalues[0]
-                
-                # All y-values before the injection time are considered background signal 
-                background_yvalues = yvalues[xvalues < injectionTime]
-                background_average = np.average(background_yvalues)
-                background_stdev = np.std(background_yvalues)
-
-                # Convert raw time to propagation time
-                yvalues = yvalues[xvalues >= injectionTime]
-                xvalues = xvalues[xvalues >= injectionTime]
-                xvalues = xvalues.subtract(injectionTime)
-
-                if peakDet == "M":
-                        peakTime = manualPeaks[x-1]
-
-                # Set time window parameters using peak time and determine the average signal within window for each run             
-                windowLow = float(peakTime - (percentage * peakTime))
-                windowHigh = float(peakTime + (percentage * peakTime))
-
-                if percentage > 0:
-                        windowIndex = xvalues.between(windowLow,windowHigh, inclusive='both')
-                        windowTimes = xvalues[windowIndex]
-                        windowSignals = yvalues[windowIndex]
-                        
-                elif percentage == 0:
-                        closestIndex = xvalues.searchsorted(float(peakTime), side='left')
-                        if xvalues[closestIndex] - peakTime >= 0.5:
-                                sg.popup_ok('prACTISed cancelled \n \nError: No time %s found in %s run %s. \nPlease try again with same times for all experimental runs.' % (peakTime, conc1, col))
-                                return False
-                
-                        windowSignals = yvalues[closestIndex]
-
-                avgSigsRun.append(np.mean(windowSignals))
-
+            # Background, time window around the peak time and average signal within window for all runs at once
+            windows = windowAverages(data['raw time'], data.iloc[:,1:], injectionTime, peakTime, percentage, timeIndexes[conc1])
+            if windows is None:
+                    practised_notify.error('prACTISed cancelled \n \nError: No time %s found in %s run %s. \nPlease try again with same times for all experimental runs.' % (peakTime, conc1, 1))
+                    return False
 
-                # Graph the signal for each run and with time window indicated
-                plt.plot(xvalues, yvalues)
-                
+            windowLow = windows['window low']
+            windowHigh = windows['window high']
 
-            # Appending a figure with all experimental runs for concentration
-            plt.xlabel('Propagation time (s)', fontweight='bold',fontsize=13)
-            if dataType == "MS":
-                    plt.ylabel('MS intensity (a.u.)', fontweight='bold', fontsize=13)
-            elif dataType == "F":
-                    plt.ylabel('Fluorescence (a.u.)', fontweight='bold', fontsize=13)
-            plt.text(minTime,maxSig*1.05, r"[%s]$\mathbf{_0}$ = %s" % (proteinName, conc1), fontweight='bold', fontsize=13)
-            plt.vlines(windowLow, 0, maxSig*1.05, linestyles='dashed',color='gray')
-            plt.vlines(windowHigh, 0, maxSig*1.05, linestyles='dashed',color='gray')
-            plt.savefig("%s/%s.png" % (subdirect, conc1))
-            graphs.append(plt.figure())
-            plt.clf()
+            # Graph with the signal of every run for the concentration and the time window indicated
+            graphs.append({'kind': 'separagram', 'path': "%s/%s.png" % (subdirect, conc1), 'ylabel': yLabel, 'legend': False,
+                           'lines': [(windows['propagation time'], windows['propagation signals'][:,col-1], None) for col in range(1, numberOfRuns)],
+                           'text': (minTime, maxSig*1.05, r"[%s]$\mathbf{_0}$ = %s" % (proteinName, conc1)),
+                           'vlines': [(windowLow, 0, maxSig*1.05, 'gray'), (windowHigh, 0, maxSig*1.05, 'gray')]})
 
             
-            # Calculating average signal for each concentration, stdev and relative stdev
-            avgSigConc = np.average(avgSigsRun)
-            avgSigConc_stdev = np.std(avgSigsRun)
+            # Average signal for each concentration, stdev and relative stdev
+            avgSigConc = windows['mean']
+            avgSigConc_stdev = windows['std']
             avgSigConc_relstdev = (avgSigConc_stdev/avgSigConc)*100
 
             concentration.append(conc1)
             signal.append(avgSigConc)
             stddev.append(avgSigConc_stdev)
             relstddev.append(avgSigConc_relstdev)
+            runMeans.append(windows['run means'])
 
             if peakDet == "P":
                 if float(conc1.partition(" ")[0]) < windowCalcConc:
@@ -234,26 +266,20 @@ def dataanalysis(fileName):
                         Rstddev.append(None)
                         relRstddev.append(None)
 
-            
+
+
         # Generate legend for run colors
         if maxRuns > 1:
-                legendFig = plt.figure("Legend plot")
-                for line in range(1, maxRuns):
-                        plt.plot(line, np.sin(line), label='Run %s' % line)
-                plt.axis('off')
-                plt.title('Reference Legend')
-                legendFig.legend(loc='center')
-                legendFig.savefig('%s/legend.png' % (subdirect))
-                plt.clf()
+                graphs.append({'kind': 'legend', 'path': '%s/legend.png' % (subdirect), 'runs': maxRuns})
        
         # Graphing separagrams for the first run for every concentration
         lastConc = 0
+        overlayLines = []
         for x in range(1,int(numberOfConcs)+1):         
             conc1 = idealSheet.cell(x,5).value
 
-            # Reading in the whole data frame (= all runs for one particular concentration) and dropping all lines that are blank, i.e. that would produce "NaN"s
-            data = pd.read_excel(fileName, sheet_name=conc1, engine='openpyxl')
-            data = data.dropna(how='all')
+            # The whole data frame (= all runs for one particular concentration)
+            data = dataset[conc1]
             xvalues = data['raw time']
             yvalues = data.iloc[:, 1]
 
@@ -268,47 +294,29 @@ def dataanalysis(fileName):
             checkConc = float(conc1.partition(" ")[0])
                 
             if checkConc == 0 or checkConc == windowCalcConc or x == numberOfConcs or any(abs(yvalues[xvalues==peakTime]-lastConc)>=0.2*maxSig):
-                p = plt.plot(xvalues, yvalues, label= '%s' % conc1)
+                overlayLines.append((xvalues.to_numpy(), yvalues.to_numpy(), '%s' % conc1))
                 lastConc = yvalues[xvalues==peakTime]
 
-        plt.xlabel('Propagation time (s)', fontweight='bold', fontsize=13)
-        if dataType == "MS":
-                plt.ylabel('MS intensity (a.u.)', fontweight='bold', fontsize=13)
-        elif dataType == "F":
-                plt.ylabel('Fluorescence (a.u.)', fontweight='bold', fontsize=13)
-        plt.text(minTime, maxSig*1.05, r"[%s]$\mathbf{_0}$"  % (proteinName), fontweight='bold', fontsize=13)
-        plt.legend(fontsize=13)
+        overlayVlines = []
         if peakDet == "P":
-                plt.vlines(windowLow, 0, maxSig*1.05, linestyles='dashed',color='gray')
-                plt.vlines(windowHigh, 0, maxSig*1.05, linestyles='dashed',color='gray')
+                overlayVlines = [(windowLow, 0, maxSig*1.05, 'gray'), (windowHigh, 0, maxSig*1.05, 'gray')]
         elif peakDet == "M":
-                plt.vlines(0, maxSig, maxSig*1.05, linestyles='dashed',color='white')
+                overlayVlines = [(0, maxSig, maxSig*1.05, 'white')]
 
-        # Appending a figure with first experimental run for all concentrations
-        plt.savefig("%s/allconcentration.png" % subdirect)           # save separagram graph
-        graphs.append(plt.figure())
-        plt.clf()
+        # Graph with first experimental run for all concentrations
+        graphs.append({'kind': 'separagram', 'path': "%s/allconcentration.png" % subdirect, 'ylabel': yLabel, 'legend': True,
+                       'lines': overlayLines, 'text': (minTime, maxSig*1.05, r"[%s]$\mathbf{_0}$"  % (proteinName)),
+                       'vlines': overlayVlines})
 
 
         ## Part 5 - Calculate R values and standard deviation of R values for each concentration
-        
-        LowProt_sig = signal[len(Rvalue)]
-        HighProt_sig = signal[len(concentration)-1]
-        LowProt_stddev = stddev[len(Rvalue)]
-        HighProt_stdDev = stddev[len(concentration)-1]
-
-
-        for y in range(0, len(concentration)):
-                conc2 = idealSheet.cell(y+1,5).value
-                if float(conc2.partition(" ")[0]) >= windowCalcConc:
-                        avgSigConc_R = (signal[y] - HighProt_sig)/ (LowProt_sig - HighProt_sig) 
-                        Rvalue.append(avgSigConc_R)
-
-                        avgSiglConc_Rstddev = ( 1/(LowProt_sig - HighProt_sig) * math.sqrt( (stddev[y]**2) + ((signal[y] - LowProt_sig)/ (LowProt_sig - HighProt_sig) * HighProt_stdDev)**2 +
-                                                                                       ((HighProt_sig - signal[y])/(LowProt_sig - HighProt_sig) * LowProt_stddev)**2))
-                        Rstddev.append(avgSiglConc_Rstddev)
-                        avgSiglConc_relRstddev = (avgSiglConc_Rstddev/avgSigConc_R)*100
-                        relRstddev.append(avgSiglConc_relRstddev)
+        firstR = len(Rvalue)
+        Rvalue_drop, Rstddev_drop = rValues(signal, stddev, firstR)
+        for avgSigConc_R, avgSiglConc_Rstddev in zip(Rvalue_drop, Rstddev_drop):
+                Rvalue.append(avgSigConc_R)
+                Rstddev.append(avgSiglConc_Rstddev)
+                avgSiglConc_relRstddev = (avgSiglConc_Rstddev/avgSigConc_R)*100
+                relRstddev.append(avgSiglConc_relRstddev)
   
         
         ## Part 6 - Plotting the binding isotherm R vs P[0] with curve of best fit
@@ -321,44 +329,24 @@ def dataanalysis(fileName):
         unit = concentration[0].partition(" ")[2]
         
 
-        Rvalue_drop = [i for i in Rvalue if i is not None]
-        Rstddev_drop = [i for i in Rstddev if i is not None]
-        
-        # Plotting data points for each concentration
-        plt.scatter(concs, Rvalue_drop, c='white', edgecolor='black', label="R", zorder=10)
-        plt.errorbar(concs, Rvalue_drop, yerr = Rstddev_drop, linestyle="none", ecolor = 'black', elinewidth=1, capsize=2, capthick=1, zorder=0)
-        plt.xscale("log")
-                      
-        # Define the Levenberg Marquardt algorithm
-        def LevenMarqu(x,a):          
-            return -((a + x - ligandConc)/(2*ligandConc)) + ((((a + x - ligandConc)/(2*ligandConc))**2) + (a/ligandConc))**(0.5)
-
-        # Curve fitting and plotting curve of best fit    
-        popt, pcov = curve_fit(LevenMarqu, concs, Rvalue_drop)
-        error = np.sqrt(np.diag(pcov))
+        # Curve fitting (Levenberg-Marquardt, optionally weighted by the R standard deviations) and plotting curve of best fit
+        popt, error, r_squared, chiSquared = fitIsotherm(concs, Rvalue_drop, ligandConc, Rstddev_drop if weighted else None)
+
+        # Confidence interval of Kd from refitting resampled runs or R values
+        if resamples > 0:
+                interval = bootstrapKd(concs, ligandConc, runMeans, firstR, Rvalue_drop, Rstddev_drop, resampling,
+                                       resamples, weighted=weighted)
 
         step=0
         if concs[step] == float(0):
                 step = 1
 
+        # Binding isotherm graph with data points for each concentration and curve of best fit
         xFit = np.arange(0.0, max(concs), concs[step])
-        plt.plot(xFit, LevenMarqu(xFit, popt), linewidth=1.5, color='black', label="Best Fit")
-        plt.text((concs[step]), 0.2, r'K$\mathbf{_d}$ = %.3g ± %.3g %s' % (popt, error, unit), fontweight='bold', fontsize=13)
-        plt.ylabel('R', fontweight='bold', fontsize=13)
-        plt.xlabel(r'[%s]$\mathbf{_0}$ (%s)' % (proteinName,unit), fontweight='bold',fontsize=13)
-        plt.xscale("log")
-        plt.legend(fontsize=13)
-        plt.savefig("%s/bindingisotherm.png" % subdirect)           # save binding isotherm graph
-        graphs.append(plt.figure())
-        plt.close()
-
-        # Statistics
-        residuals = Rvalue_drop - LevenMarqu(concs, *popt)
-        ss_res = np.sum(residuals**2)
-        ss_tot = np.sum((Rvalue_drop - np.mean(Rvalue_drop))**2)
-        r_squared = 1 - (ss_res/ss_tot)
-
-        chiSquared = sum((((Rvalue_drop - LevenMarqu(concs, *popt))**2) / LevenMarqu(concs, *popt)))
+        graphs.append({'kind': 'isotherm', 'path': "%s/bindingisotherm.png" % subdirect, 'concs': concs, 'R': Rvalue_drop,
+                       'R std': Rstddev_drop, 'fit x': xFit, 'fit y': isotherm(xFit, popt, ligandConc),
+                       'text': ((concs[step]), 0.2, r'K$\mathbf{_d}$ = %.3g ± %.3g %s' % (popt, error, unit)),
+                       'xlabel': r'[%s]$\mathbf{_0}$ (%s)' % (proteinName,unit)})
 
 
         ## Part 7 - Returning summary data and graphs
@@ -366,14 +354,9 @@ def dataanalysis(fileName):
         df = pd.DataFrame (forDF).transpose()
         df.columns = DFnames
 
-        # Create new output sheet in input Excel file with summary data
-        writer = pd.ExcelWriter(fileName, engine = 'openpyxl')
-        writer.book = inputBook
-        df.to_excel(writer, sheet_name = "Outputs", float_format='%e', index=False, startcol=3, engine = 'openpyxl')        # does not overwrite if a sheet named Outputs already exists
-        writer.save()
-        writer.close()
-
-        outputSheet = inputBook.worksheets[len(inputBook.sheetnames)-1]
+        # Create new output sheet in the working file with summary data
+        outputSheet = workingData.createSheet("Outputs")        # replaces the Outputs sheet of an earlier analysis
+        writeFrame(outputSheet, df, startcol=4, float_format='%e')
 
         # Duplicate input sheet information onto output sheet for reproducibility
         for r in range(1, 19):
@@ -385,10 +368,27 @@ def dataanalysis(fileName):
         outputSheet["L1"] = "Kd: %.4f ± %.4f %s" % (popt,error,unit)
         outputSheet["L2"] = "R²: %.4f" % (r_squared)
         outputSheet["L3"] = "χ²: %.4f" % (chiSquared)
-
-        inputBook.save(fileName)
-        
-        plt.close('all')
+        nextRow = 4
+        if resamples > 0:
+                outputSheet["L4"] = "Kd %g%% CI: %.4f to %.4f %s" % (interval['confidence'], interval['low'], interval['high'], unit)
+                outputSheet["L5"] = "CI from %d %s" % (resamples, methodNames[interval['method']])
+                nextRow = 6
+        if weighted:
+                outputSheet.cell(row=nextRow, column=12).value = "Fit weighted by R Std Dev"
+
+        workingData.save()
+
+        # Render the graphs (separagrams, legend and binding isotherm) or keep them for later
+        if graphMode == "on":
+                renderGraphs(graphs, graphWorkers)
+        elif graphMode == "defer":
+                deferGraphs(graphs, subdirect)
+
+        if returnResults:
+                results = {'Kd': popt, 'Kd error': error, 'unit': unit, 'R²': r_squared, 'χ²': chiSquared}
+                if resamples > 0:
+                        results.update({'Kd CI low': float(interval['low']), 'Kd CI high': float(interval['high'])})
+                return subdirect, results
 
         return subdirect
 
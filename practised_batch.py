@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_batch.py runs prACTISed without the GUI on many datasets:
+# raw data directories, Excel working files or working stores, given as
+# paths or glob patterns. Each dataset is prepared, compensated and
+# analyzed in a worker process and the Kd, R² and χ² of all datasets are
+# written to one CSV or JSON summary
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Raw data directories need the inputs the GUI asks for. They are read
+# from a JSON file (--parameters) with the workingfileprep argument names
+# as keys, e.g.
+#
+# {"propFlow": "5 µL/min", "injectFlow": "5 µL/min", "injectTime": 5,
+#  "sepLength": "", "sepDiam": "", "injectLength": "", "injectDiam": "",
+#  "proteinName": "MutS", "ligandName": "DNA", "ligandConc": 1,
+#  "dataType": "F", "compYN": "N", "normalConc": null, "windowWidth": 2,
+#  "peakDet": "P", "manualPeaks": null, "peakConc": 1}
+#
+# A parameters.json inside a raw data directory overrides these values
+# for that directory. Working files and stores already hold their inputs.
+#
+# Example:
+#     python practised_batch.py -p parameters.json -o summary.csv "data/*"
+
+import argparse
+import csv
+import glob
+import json
+import os
+import shutil
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from natsort import natsorted
+
+# Modules without .py extension (practised_validate, practised_compensation, ...) are loaded from the program directory
+import practised_loader
+
+parameterNames = ["propFlow", "injectFlow", "injectTime", "sepLength", "sepDiam", "injectLength", "injectDiam",
+                  "proteinName", "ligandName", "ligandConc", "dataType", "compYN", "normalConc", "windowWidth",
+                  "peakDet", "manualPeaks", "peakConc"]
+requiredNames = ["injectTime", "proteinName", "ligandConc", "dataType", "compYN", "windowWidth", "peakDet"]
+
+summaryColumns = ["dataset", "status", "Kd", "Kd error", "Kd CI low", "Kd CI high", "unit", "R²", "χ²", "working file",
+                  "graphs", "error"]
+
+
+# Expand paths and glob patterns into the list of datasets (in natural order, each only once)
+def expandDatasets(patterns):
+    datasets = []
+    for pattern in patterns:
+        matches = natsorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            path = os.path.normpath(path)
+            if path not in datasets:
+                datasets.append(path)
+    return datasets
+
+
+# Inputs for a raw data directory: the common parameters, overridden by the directory's own parameters.json
+def directoryParameters(inputPath, parameters):
+    from practised_notify import PractisedError
+
+    parameters = dict(parameters)
+    localFile = os.path.join(inputPath, "parameters.json")
+    if os.path.isfile(localFile):
+        with open(localFile, encoding="utf-8") as local:
+            parameters.update(json.load(local))
+
+    missing = [name for name in requiredNames if parameters.get(name) in (None, "")]
+    if parameters.get("compYN") == "Y" and parameters.get("normalConc") is None:
+        missing.append("normalConc")
+    if parameters.get("peakDet") == "M" and not parameters.get("manualPeaks"):
+        missing.append("manualPeaks")
+    if parameters.get("peakDet") == "P" and parameters.get("peakConc") is None:
+        missing.append("peakConc")
+    if len(missing) > 0:
+        raise PractisedError("Missing inputs for %s: %s" % (inputPath, ", ".join(missing)))
+
+    for name in ["injectTime", "ligandConc", "normalConc", "peakConc"]:
+        if parameters.get(name) is not None:
+            parameters[name] = float(parameters[name])
+
+    return dict((name, parameters.get(name)) for name in parameterNames)
+
+
+# Working file path for a raw data directory; an existing file or store is replaced with overwrite, otherwise the
+# first free numbered name is used (as suggested in the GUI)
+def workingPath(suggName, store, overwrite):
+    if store:
+        suggName = "%s.practised" % os.path.splitext(suggName)[0]
+
+    if not os.path.exists(suggName):
+        return suggName
+
+    if overwrite:
+        if os.path.isdir(suggName):
+            shutil.rmtree(suggName)
+        else:
+            os.remove(suggName)
+        return suggName
+
+    withoutExt, ext = os.path.splitext(suggName)
+    duplicate = 2
+    while os.path.exists("%s_%d%s" % (withoutExt, duplicate, ext)):
+        duplicate += 1
+    return "%s_%d%s" % (withoutExt, duplicate, ext)
+
+
+# Prepare (for raw data directories), compensate and analyze one dataset. Runs in a worker process; failures are
+# returned in the result instead of raised. graphMode, graphWorkers, weighted, resamples, resampling and peakFinder are
+# passed to dataanalysis
+def runDataset(path, parameters, store=False, overwrite=False, graphMode="on", graphWorkers=1, weighted=False,
+               resamples=10000, resampling="runs", peakFinder="maximum"):
+    from practised_notify import PractisedError
+
+    result = dict((column, None) for column in summaryColumns)
+    result["dataset"] = path
+
+    # Imported within try, so that a stage that cannot be imported fails the dataset, not the batch
+    try:
+        from practised_store import openWorkingData, isStore
+        from practised_validate import validateDirectoryContents, genErrorMessageDirect, validateExcel, \
+            genFileErrorMessage
+        from practised_working import workingfileprep
+        from practised_scan import manifestArguments
+        from practised_compensation import compensate
+        from practised_analysis import dataanalysis
+
+        if os.path.isdir(path) and not isStore(path):
+            inputs = directoryParameters(path, parameters)
+
+            checkDirect = validateDirectoryContents(path, inputs["compYN"], inputs["normalConc"], inputs["peakDet"],
+                                                    inputs["peakConc"])
+            if checkDirect[0] == False:
+                raise PractisedError(genErrorMessageDirect(checkDirect[1]).strip())
+
+            inputs.update(manifestArguments(workingfileprep, checkDirect[3]))
+            workingFile = workingfileprep(path, workingPath(checkDirect[2], store, overwrite), **inputs)
+
+        elif isStore(path) or (os.path.isfile(path) and path.endswith(".xlsx")):
+            fileResults = validateExcel(path)
+            if fileResults[0] == False:
+                raise PractisedError(genFileErrorMessage(fileResults[1]).strip())
+            workingFile = path
+
+        else:
+            raise PractisedError("%s is not a raw data directory, Excel working file or working store" % path)
+
+        result["working file"] = workingFile
+
+        if str(openWorkingData(workingFile).book["Inputs"].cell(13,2).value) == "Y":
+            compensate(workingFile)
+
+        result["graphs"], results = dataanalysis(workingFile, returnResults=True, graphMode=graphMode,
+                                                 graphWorkers=graphWorkers, weighted=weighted, resamples=resamples,
+                                                 resampling=resampling, peakFinder=peakFinder)
+        result.update(results)
+        result["status"] = "ok"
+
+    except PractisedError as error:
+        result["status"] = "failed"
+        result["error"] = str(error)
+
+    except Exception as error:
+        result["status"] = "failed"
+        result["error"] = "".join(traceback.format_exception_only(type(error), error)).strip()
+
+    return result
+
+
+# Write the summary of all datasets as JSON (.json) or CSV (any other extension)
+def writeSummary(results, outputPath):
+    if outputPath.endswith(".json"):
+        with open(outputPath, "w", encoding="utf-8") as output:
+            json.dump(results, output, ensure_ascii=False, indent=1)
+    else:
+        with open(outputPath, "w", encoding="utf-8", newline="") as output:
+            writer = csv.DictWriter(output, fieldnames=summaryColumns)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run prACTISed on many datasets without the GUI")
+    parser.add_argument("datasets", nargs="+",
+                        help="raw data directories, working files (.xlsx) or working stores (.practised), or glob patterns")
+    parser.add_argument("-p", "--parameters", help="JSON file with the inputs for raw data directories")
+    parser.add_argument("-o", "--output", default="practised_summary.csv",
+                        help="summary file, .json for JSON, CSV otherwise (default: practised_summary.csv)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--store", action="store_true",
+                        help="prepare working stores (.practised) instead of Excel working files")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="replace existing working files instead of using a numbered name")
+    parser.add_argument("--graphs", choices=["on", "off", "defer"], default="on",
+                        help="render graphs, skip them, or save them to render later with practised_graphs.py "
+                             "(default: on)")
+    parser.add_argument("--graph-jobs", type=int, default=1,
+                        help="worker processes rendering the graphs of each dataset (default: 1)")
+    parser.add_argument("--weighted", action="store_true", help="weight the isotherm fits by the R standard deviations")
+    parser.add_argument("--resamples", type=int, default=10000,
+                        help="resamples for the confidence interval of Kd, 0 for none (default: 10000)")
+    parser.add_argument("--resampling", choices=["runs", "R"], default="runs",
+                        help="resample the runs of every concentration or perturb the R values (default: runs)")
+    parser.add_argument("--peak-finder", choices=["maximum", "smoothed"], default="maximum",
+                        help="programmatic peak: highest signal of run 1 or median peak of the smoothed runs "
+                             "(default: maximum)")
+    args = parser.parse_args(argv)
+
+    parameters = {}
+    if args.parameters:
+        with open(args.parameters, encoding="utf-8") as parameterFile:
+            parameters = json.load(parameterFile)
+
+    datasets = expandDatasets(args.datasets)
+    if len(datasets) == 0:
+        parser.error("no datasets found")
+
+    # Results are collected in the order of the datasets
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(runDataset, path, parameters, args.store, args.overwrite, args.graphs, args.graph_jobs,
+                               args.weighted, args.resamples, args.resampling, args.peak_finder) for path in datasets]
+        results = []
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if result["status"] == "ok":
+                print("%s: Kd = %.4f ± %.4f %s" % (result["dataset"], result["Kd"], result["Kd error"], result["unit"]))
+            else:
+                print("%s: failed - %s" % (result["dataset"], result["error"]), file=sys.stderr)
+
+    writeSummary(results, args.output)
+    print("Summary of %d datasets written to %s" % (len(results), args.output))
+
+    return 0 if all(result["status"] == "ok" for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
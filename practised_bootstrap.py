@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_bootstrap.py calculates a percentile confidence interval for
+# the Kd of prACTISed by resampling: either the replicate runs of every
+# concentration are drawn with replacement (bootstrap), or the R values
+# are perturbed with their standard deviations (Monte Carlo). Resamples
+# are drawn for all replicates at once and refitted as one batch with
+# practised_fit.fitIsotherms, optionally split over worker processes
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Resampling methods and how they are named on the Outputs sheet
+methodNames = {'runs': 'resamples of the runs', 'R': 'Monte Carlo R values'}
+
+# Resamples fitted per worker task
+chunkSize = 2500
+
+
+# R values (resamples x concentrations from first on) from resampled runs: for every concentration the mean window
+# signals of its runs (runMeans, NaN for missing runs) are drawn with replacement and averaged as in dataanalysis
+def resampleRuns(runMeans, first, resamples, rng):
+    import numpy as np
+    from practised_analysis import rValues
+
+    signal = np.empty((len(runMeans), resamples))
+    stddev = np.empty((len(runMeans), resamples))
+    for x, means in enumerate(runMeans):
+        means = np.asarray(means, dtype=float)
+        means = means[~np.isnan(means)]
+        samples = means[rng.integers(0, len(means), (resamples, len(means)))]
+        signal[x] = samples.mean(axis=1)
+        stddev[x] = samples.std(axis=1)
+
+    return np.array(rValues(signal, stddev, first)[0]).T
+
+
+# R values (resamples x concentrations) drawn from normal distributions around the R values with their standard
+# deviations
+def perturbR(Rvalue, Rstddev, resamples, rng):
+    import numpy as np
+
+    Rvalue = np.asarray(Rvalue, dtype=float)
+    return Rvalue + rng.standard_normal((resamples, len(Rvalue))) * np.abs(np.asarray(Rstddev, dtype=float))
+
+
+# Fit one chunk of resamples (module level so that it can run in a worker process); returns the Kd values
+def fitChunk(concs, Rvalue, ligandConc, sigma):
+    from practised_fit import fitIsotherms
+
+    return fitIsotherms(concs, Rvalue, ligandConc, sigma)['Kd']
+
+
+# Confidence interval (in %) of Kd. method "runs" resamples the runs (runMeans per concentration; first is the index of
+# the lowest concentration used in the fit) and "R" perturbs the R values used in the fit; "runs" falls back to "R" if a
+# concentration has only one run. concs are the concentrations used in the fit. With weighted all fits are weighted by
+# the R standard deviations of the data (Rstddev). seed makes the resamples reproducible; workers is the number of
+# processes (1 fits in this process, None uses all cores). Returns a dictionary with the interval (low, high), median,
+# method used, number of resamples and the number of failed fits
+def bootstrapKd(concs, ligandConc, runMeans, first, Rvalue, Rstddev, method="runs", resamples=10000, confidence=95,
+                weighted=False, seed=0, workers=1):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    if method == "runs" and min(np.sum(~np.isnan(np.asarray(means, dtype=float))) for means in runMeans) < 2:
+        method = "R"
+
+    if method == "runs":
+        R = resampleRuns(runMeans, first, resamples, rng)
+    elif method == "R":
+        R = perturbR(Rvalue, Rstddev, resamples, rng)
+    else:
+        raise ValueError("Unknown resampling method '%s'" % method)
+
+    sigma = Rstddev if weighted else None
+    chunks = [(concs, R[start:start+chunkSize], ligandConc, sigma) for start in range(0, resamples, chunkSize)]
+    if workers == 1 or len(chunks) <= 1:
+        Kd = np.concatenate([fitChunk(*chunk) for chunk in chunks])
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            Kd = np.concatenate(list(pool.map(fitChunk, *zip(*chunks))))
+
+    fitted = Kd[np.isfinite(Kd)]
+    result = {'method': method, 'resamples': resamples, 'failed': int(resamples - len(fitted)),
+              'confidence': confidence, 'low': np.nan, 'median': np.nan, 'high': np.nan}
+    if len(fitted) > 0:
+        result['low'], result['median'], result['high'] = np.percentile(fitted, [(100 - confidence)/2, 50,
+                                                                                 (100 + confidence)/2])
+    return result
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_cache.py keeps decoded Karat32 traces on disk so that an
+# unchanged .dat file is not parsed and decompressed again every time
+# a working file is prepared
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Each entry is an .npz file in the cache directory holding the time and
+# signal arrays of every extracted trace plus the chrom header and trace
+# headers as JSON. Entries are named after a hash of the file path, size,
+# modification time, content and requested trace ids, so a changed file
+# never hits an old entry. The cache directory is limited in size; the
+# least recently used entries are removed first.
+
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from practised_knuteon import readTraces
+
+
+# Default location and size limit, can be changed with environment variables
+cacheDirectory = os.environ.get('PRACTISED_CACHE', os.path.join(os.path.expanduser('~'), '.practised_cache'))
+cacheLimit = int(os.environ.get('PRACTISED_CACHE_SIZE', 2 * 1024**3))
+
+
+# Hash identifying a data file by path, size, modification time and content (plus the requested traces)
+def cacheKey(inputFile, traceids=None):
+    stat = os.stat(inputFile)
+    key = hashlib.sha1()
+    key.update(("%s|%d|%d|%s|" % (os.path.abspath(inputFile), stat.st_size, stat.st_mtime_ns,
+                                   "all" if traceids is None else ",".join(sorted(traceids)))).encode())
+
+    with open(inputFile, "rb") as dataFile:
+        for block in iter(lambda: dataFile.read(1024*1024), b""):
+            key.update(block)
+
+    return key.hexdigest()
+
+
+# Convert chrom header values (datetime, Windows path) to JSON and back
+def headerToJSON(header):
+    header = dict(header)
+    header['runtime'] = header['runtime'].isoformat()
+    header['method path'] = str(header['method path'])
+    return header
+
+def headerFromJSON(header):
+    header['runtime'] = datetime.datetime.fromisoformat(header['runtime'])
+    header['method path'] = pathlib.PureWindowsPath(header['method path'])
+    return header
+
+
+# Remove a cache entry; another process (e.g. a parallel ingestion worker) may have removed it already, or the cache
+# directory may be read-only
+def removeEntry(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Remove least recently used entries until the cache directory fits into maxSize bytes. Several processes may evict at
+# the same time, so entries can disappear at any point
+def evictCache(cacheDir, maxSize):
+    entries = []
+    for name in os.listdir(cacheDir):
+        if name.endswith(".npz"):
+            path = os.path.join(cacheDir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(entry[1] for entry in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= maxSize:
+            break
+        removeEntry(path)
+        total -= size
+
+
+# Same as readTraces, but served from the cache if the file was decoded before
+def readTracesCached(inputFile, traceids=None, cacheDir=None, maxSize=None):
+    if cacheDir is None:
+        cacheDir = cacheDirectory
+    if maxSize is None:
+        maxSize = cacheLimit
+
+    # The cache is only an optimization: without a usable cache directory the file is decoded every time
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+    except OSError:
+        return readTraces(inputFile, traceids)
+    entry = os.path.join(cacheDir, "%s.npz" % cacheKey(inputFile, traceids))
+
+    # Cache hit; mark as recently used
+    if os.path.exists(entry):
+        try:
+            with np.load(entry) as cached:
+                meta = json.loads(str(cached['meta']))
+                traces = {}
+                for traceid in meta['traces']:
+                    traces[traceid] = {'time': cached['time %s' % traceid], 'signal': cached['signal %s' % traceid],
+                                       'header': meta['traces'][traceid]}
+            try:
+                os.utime(entry)
+            except OSError:
+                pass
+            return headerFromJSON(meta['header']), traces
+
+        # Unreadable entry (e.g. interrupted write, truncated file) or removed meanwhile, decode again below
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            removeEntry(entry)
+
+    header, traces = readTraces(inputFile, traceids)
+
+    arrays = {'meta': np.array(json.dumps({'header': headerToJSON(header),
+                                           'traces': {traceid: traces[traceid]['header'] for traceid in traces}}))}
+    for traceid in traces:
+        arrays['time %s' % traceid] = traces[traceid]['time']
+        arrays['signal %s' % traceid] = traces[traceid]['signal']
+
+    # Write to a temporary file first so that other processes never read half an entry. If the cache directory is full
+    # or read-only, the traces are just not cached
+    temp = "%s.%d.tmp" % (entry, os.getpid())
+    try:
+        with open(temp, "wb") as cacheFile:
+            np.savez(cacheFile, **arrays)
+        os.replace(temp, entry)
+        evictCache(cacheDir, maxSize)
+    except OSError:
+        removeEntry(temp)
+
+    return header, traces
+
+
+# Same as practised_knuteon.readTrace (first detector trace as data frame), but using the cache
+def readTraceCached(inputFile, cacheDir=None, maxSize=None):
+    header, traces = readTracesCached(inputFile, [str(0)], cacheDir, maxSize)
+    if str(0) not in traces:
+        raise RuntimeError("No detector trace with id 0 found in %s" % inputFile)
+
+    run = pd.DataFrame({0: traces[str(0)]['time'], 1: traces[str(0)]['signal']})
+    return run
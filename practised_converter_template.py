@@ -34,9 +34,12 @@ from natsort import natsorted
     
 # Function workingfileprep() to be called by practised.py
 # Input parameters passed from GUI
+# useCache, workers and manifest (the run files found by practised_scan.scanDirectory) are passed by practised.py and
+# practised_batch.py for the built-in converter (practised_working.py) and can be ignored by other converters
 def workingfileprep(inputPath, workingFilePath, propFlow, injectFlow, injectTime, sepLength, sepDiam,
                     injectLength, injectDiam, proteinName, ligandName, ligandConc,
-                    dataType, compYN, normalConc, windowWidth, peakDet, manualPeaks, peakConc):
+                    dataType, compYN, normalConc, windowWidth, peakDet, manualPeaks, peakConc, useCache=True,
+                    workers=1, manifest=None):
 
     
     
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_fit.py fits the binding isotherm of prACTISed to R values.
+# The model has one parameter (Kd) and its derivative is known, so the
+# Levenberg-Marquardt fit is written out with the analytic Jacobian and
+# runs for many isotherms at once: every array operation works on the
+# whole batch (e.g. all points of a parameter sweep or all bootstrap
+# resamples). Fits can be weighted with the standard deviations of the
+# R values
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Convergence tolerances (the defaults of scipy's curve_fit / MINPACK)
+ftol = 1.49012e-08
+xtol = 1.49012e-08
+
+
+# Binding isotherm: R at protein concentration x for the dissociation constant a and initial ligand concentration
+def isotherm(x, a, ligandConc):
+    return -((a + x - ligandConc)/(2*ligandConc)) + ((((a + x - ligandConc)/(2*ligandConc))**2) + (a/ligandConc))**(0.5)
+
+
+# Derivative of the binding isotherm with respect to a
+def isothermJacobian(x, a, ligandConc):
+    import numpy as np
+
+    u = (a + x - ligandConc)/(2*ligandConc)
+    return ((u + 1)/np.sqrt(u**2 + a/ligandConc) - 1)/(2*ligandConc)
+
+
+# Fit the binding isotherm to a batch of R value sets. concs holds the concentrations, either shared (n) or per set
+# (sets x n); Rvalue holds the R values (sets x n), NaN where a concentration is not used in a set. With sigma (same
+# shape as Rvalue) the residuals are weighted by 1/sigma; as with curve_fit the errors are scaled by the reduced χ² of
+# the fit, so only the relative sigma matter. ligandConc and p0 (start value of Kd) are one value or one per set.
+# Returns a dictionary of arrays (one value per set): Kd, Kd error, R², χ² (as in dataanalysis) and converged.
+# Sets that cannot be fitted (no R values, sigma of 0 or NaN) have NaN values
+def fitIsotherms(concs, Rvalue, ligandConc, sigma=None, p0=1.0, maxIterations=200):
+    import numpy as np
+
+    Rvalue = np.atleast_2d(np.asarray(Rvalue, dtype=float))
+    sets = len(Rvalue)
+    concs = np.broadcast_to(np.asarray(concs, dtype=float), Rvalue.shape)
+    ligandConc = np.broadcast_to(np.asarray(ligandConc, dtype=float), (sets,))[:,None]
+    used = ~np.isnan(Rvalue)
+    points = used.sum(axis=1)
+
+    if sigma is None:
+        weights = used.astype(float)
+    else:
+        sigma = np.broadcast_to(np.asarray(sigma, dtype=float), Rvalue.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(used, 1/sigma, 0.0)
+    fittable = np.all(np.isfinite(weights), axis=1) & (points > 0)
+    weights = np.where(np.isfinite(weights), weights, 0.0)
+    R = np.where(used, Rvalue, 0.0)
+
+    # Weighted residuals, their sum of squares and the weighted Jacobian for Kd values a (one per set)
+    def evaluate(a):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            residuals = (R - isotherm(concs, a[:,None], ligandConc)) * weights
+            jacobian = isothermJacobian(concs, a[:,None], ligandConc) * weights
+        return residuals, np.sum(residuals**2, axis=1), jacobian
+
+    a = np.array(np.broadcast_to(np.asarray(p0, dtype=float), (sets,)))
+    residuals, cost, jacobian = evaluate(a)
+    damping = np.full(sets, 1e-3)
+    active = fittable & np.isfinite(cost)
+    converged = np.zeros(sets, dtype=bool)
+
+    # Levenberg-Marquardt with Marquardt's scaling: for one parameter the damped normal equation is a division
+    for iteration in range(maxIterations):
+        if not active.any():
+            break
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            JtJ = np.sum(jacobian**2, axis=1)
+            step = np.sum(jacobian * residuals, axis=1) / (JtJ * (1 + damping))
+        trial = np.where(active, a + step, a)
+        trialResiduals, trialCost, trialJacobian = evaluate(trial)
+
+        better = active & np.isfinite(trialCost) & (trialCost <= cost)
+        done = better & ((np.abs(step) <= xtol*(np.abs(trial) + xtol)) | (cost - trialCost <= ftol*cost))
+
+        a = np.where(better, trial, a)
+        cost = np.where(better, trialCost, cost)
+        residuals = np.where(better[:,None], trialResiduals, residuals)
+        jacobian = np.where(better[:,None], trialJacobian, jacobian)
+        damping = np.where(better, damping/10, damping*10)
+
+        # No step decreases the cost any more: the minimum is reached (within the precision of the cost)
+        stuck = active & ~better & (damping > 1e16)
+        converged |= done | stuck
+        active &= ~(done | stuck)
+
+    # Error of Kd from the covariance (JᵀJ)⁻¹ scaled by the reduced χ² of the fit (inf without degrees of freedom)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        JtJ = np.sum(jacobian**2, axis=1)
+        variance = np.where(points > 1, cost / (points - 1), np.inf) / JtJ
+        error = np.sqrt(np.where(variance >= 0, variance, np.inf))
+
+        # Statistics of the unweighted R values
+        fit = isotherm(concs, a[:,None], ligandConc)
+        ss_res = np.sum(np.where(used, (Rvalue - fit)**2, 0.0), axis=1)
+        mean = np.sum(R, axis=1) / points
+        ss_tot = np.sum(np.where(used, (Rvalue - mean[:,None])**2, 0.0), axis=1)
+        r_squared = 1 - (ss_res/ss_tot)
+        chiSquared = np.sum(np.where(used, (Rvalue - fit)**2 / fit, 0.0), axis=1)
+
+    failed = ~converged
+    return {'Kd': np.where(failed, np.nan, a), 'Kd error': np.where(failed, np.nan, error),
+            'R²': np.where(failed, np.nan, r_squared), 'χ²': np.where(failed, np.nan, chiSquared),
+            'converged': converged}
+
+
+# Fit of one binding isotherm (see fitIsotherms); returns Kd, its error, R² and χ². Raises ValueError for R values
+# or sigma that cannot be fitted and RuntimeError if the fit does not converge
+def fitIsotherm(concs, Rvalue, ligandConc, sigma=None):
+    import numpy as np
+
+    if not np.all(np.isfinite(np.asarray(Rvalue, dtype=float))):
+        raise ValueError("The R values must be finite to fit the binding isotherm")
+    if sigma is not None and not np.all(np.isfinite(sigma) & (np.asarray(sigma, dtype=float) != 0)):
+        raise ValueError("The R standard deviations of a weighted fit must be finite and not 0")
+
+    fit = fitIsotherms(concs, [Rvalue], ligandConc, None if sigma is None else [sigma])
+    if not fit['converged'][0]:
+        raise RuntimeError("Optimal parameters not found: the binding isotherm fit did not converge")
+    return float(fit['Kd'][0]), float(fit['Kd error'][0]), float(fit['R²'][0]), float(fit['χ²'][0])
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_graphs.py renders the separagram, legend and binding isotherm
+# graphs of practised_analysis.py (and the sensitivity graph of
+# practised_sweep.py) off-screen (matplotlib Agg, no pyplot), one after
+# another or in worker processes. Graphs can also be deferred:
+# their data is saved in the graph folder and rendered later, e.g. with
+#
+#     python practised_graphs.py experiment_graphs
+#
+# Each graph is described by a dictionary (kind, path and what to draw)
+# built by dataanalysis, so rendering is independent of the analysis
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import pickle
+import sys
+
+deferredName = "graphs.pickle"
+
+
+# New figure with its own Agg canvas (independent of pyplot and any GUI backend)
+def newFigure():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig
+
+
+# Reduce a trace to at most four points (first, minimum, maximum, last) per bucket of the time axis, in their original
+# order. With one bucket per pixel column the drawn line is the same as for the full trace (peaks and the signal at the
+# window markers are kept), but much faster to draw. NaN (e.g. the end of a shorter run) is kept as gap. x must be
+# ascending; traces with up to 4 points per bucket are returned unchanged
+def decimate(x, y, buckets):
+    import numpy as np
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= 4*buckets:
+        return x, y
+
+    # Bucket boundaries of equal time width; empty buckets are dropped
+    edges = np.searchsorted(x, np.linspace(x[0], x[-1], buckets + 1)[1:-1], side='left')
+    starts = np.unique(np.concatenate(([0], edges[edges < len(x)])))
+    ends = np.append(starts[1:], len(x))
+    bucket = np.repeat(np.arange(len(starts)), ends - starts)
+
+    # First index of the minimum and maximum of every bucket (NaN only counts if the whole bucket is NaN)
+    low = np.where(np.isnan(y), np.inf, y)
+    high = np.where(np.isnan(y), -np.inf, y)
+    minima = np.flatnonzero(low == np.minimum.reduceat(low, starts)[bucket])
+    maxima = np.flatnonzero(high == np.maximum.reduceat(high, starts)[bucket])
+    minima = minima[np.unique(bucket[minima], return_index=True)[1]]
+    maxima = maxima[np.unique(bucket[maxima], return_index=True)[1]]
+
+    keep = np.unique(np.concatenate((starts, ends - 1, minima, maxima)))
+    return x[keep], y[keep]
+
+
+# Number of pixel columns of a figure, used as number of buckets for decimate
+def pixelWidth(fig):
+    return int(fig.get_figwidth() * fig.dpi)
+
+
+# Separagram: signal lines against propagation time, with optional legend, label text and time window lines
+def renderSeparagram(fig, graph):
+    ax = fig.add_subplot()
+    for x, y, label in graph['lines']:
+        x, y = decimate(x, y, pixelWidth(fig))
+        ax.plot(x, y, label=label)
+
+    ax.set_xlabel('Propagation time (s)', fontweight='bold', fontsize=13)
+    if graph['ylabel'] is not None:
+        ax.set_ylabel(graph['ylabel'], fontweight='bold', fontsize=13)
+    ax.text(graph['text'][0], graph['text'][1], graph['text'][2], fontweight='bold', fontsize=13)
+    if graph['legend']:
+        ax.legend(fontsize=13)
+    for x, ymin, ymax, color in graph['vlines']:
+        ax.vlines(x, ymin, ymax, linestyles='dashed', color=color)
+
+
+# Reference legend for the colors of the runs
+def renderLegend(fig, graph):
+    import numpy as np
+
+    ax = fig.add_subplot()
+    for line in range(1, graph['runs']):
+        ax.plot(line, np.sin(line), label='Run %s' % line)
+    ax.axis('off')
+    ax.set_title('Reference Legend')
+    fig.legend(loc='center')
+
+
+# Binding isotherm: R values with error bars and curve of best fit
+def renderIsotherm(fig, graph):
+    ax = fig.add_subplot()
+    ax.scatter(graph['concs'], graph['R'], c='white', edgecolor='black', label="R", zorder=10)
+    ax.errorbar(graph['concs'], graph['R'], yerr=graph['R std'], linestyle="none", ecolor='black', elinewidth=1,
+                capsize=2, capthick=1, zorder=0)
+    ax.set_xscale("log")
+    ax.plot(graph['fit x'], graph['fit y'], linewidth=1.5, color='black', label="Best Fit")
+    ax.text(graph['text'][0], graph['text'][1], graph['text'][2], fontweight='bold', fontsize=13)
+    ax.set_ylabel('R', fontweight='bold', fontsize=13)
+    ax.set_xlabel(graph['xlabel'], fontweight='bold', fontsize=13)
+    ax.set_xscale("log")
+    ax.legend(fontsize=13)
+
+
+# Sensitivity of Kd to the window width (practised_sweep.py): Kd with error bars, one line per peak reference, and the
+# Kd of the working file's own inputs as dashed line. The y axis shows all Kd values, very large error bars are cut
+def renderSensitivity(fig, graph):
+    import numpy as np
+
+    ax = fig.add_subplot()
+    for widths, Kd, error, label in graph['lines']:
+        ax.errorbar(widths, Kd, yerr=error, marker='o', markersize=3, linewidth=1, capsize=2, label=label)
+    if graph['reference'] is not None:
+        ax.axhline(graph['reference'], linestyle='dashed', color='gray', label='Working file inputs')
+
+    Kd = np.array([value for line in graph['lines'] for value in line[1]], dtype=float)
+    Kd = Kd[np.isfinite(Kd)]
+    if len(Kd) > 0:
+        margin = max(Kd.max() - Kd.min(), abs(Kd.max())*0.1, 1e-12) * 0.1
+        ax.set_ylim(Kd.min() - margin, Kd.max() + margin)
+    ax.set_xlabel('Window width (%)', fontweight='bold', fontsize=13)
+    ax.set_ylabel(graph['ylabel'], fontweight='bold', fontsize=13)
+    ax.legend(fontsize=9)
+
+
+renderers = {'separagram': renderSeparagram, 'legend': renderLegend, 'isotherm': renderIsotherm,
+             'sensitivity': renderSensitivity}
+
+
+# Render one graph to its path (module level so that it can run in a worker process)
+def renderGraph(graph):
+    fig = newFigure()
+    renderers[graph['kind']](fig, graph)
+    fig.savefig(graph['path'])
+    return graph['path']
+
+
+# Render all graphs; workers is the number of processes, 1 renders in this process and None uses all cores
+def renderGraphs(graphs, workers=1):
+    if workers == 1 or len(graphs) <= 1:
+        return [renderGraph(graph) for graph in graphs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(renderGraph, graphs))
+
+
+# Save the graphs of an analysis in its graph folder to render them later
+def deferGraphs(graphs, graphFolder):
+    with open(os.path.join(graphFolder, deferredName), "wb") as deferred:
+        pickle.dump(graphs, deferred)
+
+
+# Render the deferred graphs of a graph folder; returns the image paths (empty if nothing was deferred)
+def renderDeferred(graphFolder, workers=1):
+    deferredPath = os.path.join(graphFolder, deferredName)
+    if not os.path.exists(deferredPath):
+        return []
+
+    with open(deferredPath, "rb") as deferred:
+        graphs = pickle.load(deferred)
+
+    paths = renderGraphs(graphs, workers)
+    os.remove(deferredPath)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render deferred prACTISed graphs")
+    parser.add_argument("folders", nargs="+", help="graph folders of analyses run with deferred graphs")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    for folder in args.folders:
+        paths = renderDeferred(folder, args.jobs)
+        print("%s: %d graphs rendered" % (folder, len(paths)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
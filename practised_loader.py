@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_loader.py makes the modules of prACTISed without .py
+# extension (practised_validate, practised_compensation, practised_knuteon,
+# practised_pwexplode, practised_pdfReport) importable: importing it adds
+# a finder that loads them from the program directory with
+# SourceFileLoader, after the usual import path is searched. Imported
+# first by practised.py, practised_batch.py, the startup check and the tests
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+programDirectory = os.path.dirname(os.path.abspath(__file__))
+
+
+class ProgramFiles:
+    @staticmethod
+    def find_spec(name, path=None, target=None):
+        file = os.path.join(programDirectory, name)
+        if path is None and name.startswith('practised_') and os.path.isfile(file):
+            return importlib.util.spec_from_loader(name, importlib.machinery.SourceFileLoader(name, file))
+
+
+if ProgramFiles not in sys.meta_path:
+    sys.meta_path.append(ProgramFiles)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_notify.py reports warnings and errors of the prACTISed stages:
+# as popups when running in the GUI (practised.py), otherwise on stderr
+# (warnings) or as PractisedError (errors), so that scripts and the batch
+# command line can handle failures per dataset
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+
+# Set to True by practised.py
+guiMode = False
+
+
+class PractisedError(Exception):
+    pass
+
+
+# Non-fatal message; a non-blocking popup in the GUI
+def warning(message):
+    if guiMode:
+        import PySimpleGUI as sg
+        sg.popup_ok(message, non_blocking=True)
+    else:
+        print("Warning: %s" % message, file=sys.stderr)
+
+
+# Fatal message; in the GUI a popup is shown and the caller returns False, otherwise PractisedError is raised
+def error(message):
+    if guiMode:
+        import PySimpleGUI as sg
+        sg.popup_ok(message)
+    else:
+        raise PractisedError(message)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_peaks.py finds the peak time of ACTIS separagrams for the
+# programmatic peak determination of prACTISed. By default it is the
+# time of the highest signal of the first run at the reference
+# concentration. Optionally the signal of every run is smoothed
+# (Savitzky-Golay) and the median of the most prominent peaks is taken,
+# so that single noise spikes do not move the time window. TimeIndex
+# holds the time axis of one concentration with its injection point, so
+# that window and peak lookups reuse it
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Savitzky-Golay window in seconds (at least 5 samples) and polynomial order
+smoothingTime = 2.0
+polyOrder = 2
+
+# Minimum prominence of a peak as fraction of the range of the smoothed signal
+minProminence = 0.1
+
+
+# Time axis (raw time, ascending) of one concentration: the index of the injection time, the propagation time after it
+# and lookups of the time window and of manually given peak times
+class TimeIndex:
+
+    def __init__(self, time, injectionTime):
+        import numpy as np
+
+        self.time = np.asarray(time, dtype=float)
+        self.injectionTime = injectionTime
+
+        # All values before the injection time are background signal, the rest is converted to propagation time
+        self.injection = int(np.searchsorted(self.time, injectionTime, side='left'))
+        self.propagation = self.time[self.injection:] - injectionTime
+
+    # Index range (low, high) of the propagation times within percentage of the peak time; with percentage 0 the first
+    # time at or after the peak time, None if it is not within 0.5 s
+    def window(self, peakTime, percentage):
+        import numpy as np
+
+        if percentage > 0:
+            low = np.searchsorted(self.propagation, float(peakTime - (percentage * peakTime)), side='left')
+            high = np.searchsorted(self.propagation, float(peakTime + (percentage * peakTime)), side='right')
+        else:
+            low = np.searchsorted(self.propagation, float(peakTime), side='left')
+            high = low + 1
+            if low == len(self.propagation) or self.propagation[low] - peakTime >= 0.5:
+                return None
+        return int(low), int(high)
+
+    # Raw time before a manually given time (the peak time used for manual peak determination)
+    def rawTimeBefore(self, time):
+        import numpy as np
+
+        return float(self.time[np.searchsorted(self.time, float(time), side='left') - 1])
+
+
+# Savitzky-Golay coefficients for smoothing (value of the least squares polynomial at the center of the window)
+def savgolCoefficients(window, order):
+    import numpy as np
+
+    half = window // 2
+    return np.linalg.pinv(np.vander(np.arange(-half, half + 1), order + 1, increasing=True))[0]
+
+
+# Smoothed propagation signal of every run (propagation time x runs). All runs are convolved with the Savitzky-Golay
+# coefficients at once (FFT); the ends are extended with the first and last value of each run. Samples after the end
+# of a shorter run stay NaN
+def smoothRuns(timeIndex, signals):
+    import numpy as np
+
+    signals = np.asarray(signals, dtype=float).reshape(len(timeIndex.time), -1)[timeIndex.injection:]
+    missing = np.isnan(signals)
+    lengths = np.sum(~missing, axis=0)
+    if len(signals) == 0 or lengths.max() == 0:
+        return signals
+
+    window = max(5, int(smoothingTime / np.median(np.diff(timeIndex.time))) | 1) if len(timeIndex.time) > 1 else 5
+    half = window // 2
+    if lengths.max() <= window:
+        return signals
+
+    # NaN after the end of a run is replaced with its last value (runs without any value stay 0)
+    last = signals[np.maximum(lengths - 1, 0), np.arange(signals.shape[1])]
+    values = np.where(missing, np.where(np.isnan(last), 0.0, last), signals)
+    padded = np.concatenate((np.repeat(values[:1], half, axis=0), values, np.repeat(values[-1:], half, axis=0)))
+
+    size = len(padded) + window - 1
+    spectrum = np.fft.rfft(padded, size, axis=0) * np.fft.rfft(savgolCoefficients(window, polyOrder), size)[:,None]
+    smoothed = np.fft.irfft(spectrum, size, axis=0)[2*half:2*half + len(values)]
+    smoothed[missing] = np.nan
+    return smoothed
+
+
+# Lowest value from start (excluded) up to the next value higher than level, searching in direction (1 or -1) in
+# growing chunks, so that small noise peaks only look at their neighbourhood
+def baseTowards(values, start, direction, level):
+    import numpy as np
+
+    lowest = values[start]
+    chunk = 64
+    position = start
+    while 0 <= position + direction < len(values):
+        if direction > 0:
+            part = values[position + 1:position + 1 + chunk]
+        else:
+            part = values[max(position - chunk, 0):position][::-1]
+        higher = np.flatnonzero(part > level)
+        if len(higher) > 0:
+            return min(lowest, part[:higher[0]].min()) if higher[0] > 0 else lowest
+        lowest = min(lowest, part.min())
+        position += direction * len(part)
+        chunk *= 2
+    return lowest
+
+
+# Peaks of one smoothed run: indices and prominences of all peaks (local maxima) with a prominence of at least
+# minProminence, or the highest sample if there is none. The prominence is the height of a peak above the higher of the
+# lowest points between it and the next higher sample on either side
+def runPeaks(smoothed):
+    import numpy as np
+
+    values = smoothed[~np.isnan(smoothed)]
+    if len(values) < 3:
+        return np.arange(len(values))[np.argmax(values):][:1], np.zeros(min(len(values), 1))
+
+    threshold = minProminence * (values.max() - values.min())
+    inner = values[1:-1]
+    candidates = np.flatnonzero((inner > values[:-2]) & (inner >= values[2:]) & (inner - values.min() >= threshold)) + 1
+
+    peaks = []
+    prominences = []
+    for peak in candidates:
+        prominence = values[peak] - max(baseTowards(values, peak, -1, values[peak]),
+                                        baseTowards(values, peak, 1, values[peak]))
+        if prominence >= threshold:
+            peaks.append(peak)
+            prominences.append(prominence)
+
+    if len(peaks) == 0:
+        return np.array([np.argmax(values)]), np.array([0.0])
+    return np.array(peaks), np.array(prominences)
+
+
+# Peak time (propagation time) of every run: the most prominent peak of the smoothed signal
+def peakTimes(timeIndex, signals):
+    import numpy as np
+
+    smoothed = smoothRuns(timeIndex, signals)
+    times = np.full(smoothed.shape[1], np.nan)
+    for run in range(smoothed.shape[1]):
+        peaks, prominences = runPeaks(smoothed[:,run])
+        if len(peaks) > 0:
+            times[run] = timeIndex.propagation[peaks[np.argmax(prominences)]]
+    return times
+
+
+# Peak time of the reference concentration from the smoothed runs: the median of the peak times of its runs
+def smoothedPeakTime(timeIndex, signals):
+    import numpy as np
+
+    return float(np.nanmedian(peakTimes(timeIndex, signals)))
+
+
+# Peak time of the reference concentration as in prACTISed before: the propagation time of the highest signal of the
+# first run after the injection time (the first one if it occurs more than once)
+def maximumPeakTime(timeIndex, signals):
+    import numpy as np
+
+    signal = np.asarray(signals, dtype=float).reshape(len(timeIndex.time), -1)[timeIndex.injection:, 0]
+    return float(timeIndex.propagation[np.nanargmax(signal)])
+
+
+# Peak finders for programmatic peak determination
+peakFinders = {'maximum': maximumPeakTime, 'smoothed': smoothedPeakTime}
+
+
+# Peak time of the reference concentration (time index and signals, time x runs) with the peak finder named finder
+def referencePeakTime(timeIndex, signals, finder="maximum"):
+    if finder not in peakFinders:
+        raise ValueError("Unknown peak finder '%s'" % finder)
+    return peakFinders[finder](timeIndex, signals)
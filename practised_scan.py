@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_scan.py reads only the metadata of the ACTIS run files in a
+# directory (no signal data is decoded) and returns a manifest used for
+# validation and run ordering before the working file is prepared
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import os
+import struct
+
+import olefile
+
+
+def isfloat(num):
+    try:
+        float(num)
+        return True
+    except ValueError:
+        return False
+
+
+# Extract concentration, concentration prefix and run number from a file name (see naming conventions)
+def parseRunName(file):
+    molar = file.find("M")
+    prefix = file[molar-1]
+    conc = float(file.partition(prefix)[0])
+
+    name = os.path.splitext(file)[0]
+    if name[-1].isdigit()==True:
+        if name[-2:].isdigit()==True:
+            runNumber = int(name[-2:])
+        else:
+            runNumber = int(name[-1])
+    else:
+        runNumber = 1
+
+    return conc, prefix, runNumber
+
+
+# Keyword arguments that pass the manifest to a workingfileprep: converters made from practised_converter_template.py
+# before it took a manifest are called without it
+def manifestArguments(workingfileprep, manifest):
+    import inspect
+
+    parameters = inspect.signature(workingfileprep).parameters.values()
+    if any(parameter.name == "manifest" or parameter.kind == parameter.VAR_KEYWORD for parameter in parameters):
+        return {"manifest": manifest}
+    return {}
+
+
+# Read the metadata of a Karat32 .dat file: chrom header, Detector Trace Handler entry of trace 0 and the number of
+# points from the first bytes of its data stream
+def scanDat(filePath):
+    from practised_knuteon import read_chrom_header, read_traces
+
+    ole = olefile.OleFileIO(filePath)
+    try:
+        header = read_chrom_header(ole)
+        traces = [trace for trace in read_traces(ole) if trace['id'] == str(0)]
+        if len(traces) == 0:
+            raise RuntimeError("No detector trace with id 0 found")
+        trace = traces[0]
+
+        # Stream starts with version, number of points, maximum points, channels, compression flag
+        datastream = ole.openstream(['Detector Data', 'Detector %s Trace' % trace['id']])
+        version, nopoints = struct.unpack('<II', datastream.read(8))
+    finally:
+        ole.close()
+
+    return {'sample rate': trace['sample rate'], 'multiplier': trace['multiplier'], 'points': nopoints,
+            'acquisition time': header['runtime'], 'detector': header['detector']}
+
+
+# Read only the preamble of an .asc/.txt file (up to the first numeric row); the data rows are only counted
+def scanAscii(filePath):
+    preamble = []
+    firstRows = []
+    points = 0
+
+    with open(filePath, "r", encoding="latin-1") as fileCheck:
+        for line in fileCheck:
+            row = line.split()
+            if len(firstRows) == 0 and (len(row) == 0 or not isfloat(row[0])):
+                preamble.append(line.rstrip("\r\n").split("\t"))
+                continue
+
+            if len(row) > 0:
+                if len(firstRows) < 2:
+                    firstRows.append(row)
+                points += 1
+
+    info = {'sample rate': None, 'multiplier': 1.0, 'points': points, 'acquisition time': None}
+
+    for row in preamble:
+        if "Sampling Rate:" in row[0]:
+            info['sample rate'] = float(row[1])
+        elif "Y Axis Multiplier:" in row[0]:
+            info['multiplier'] = float(row[1])
+        elif "Total Data Points:" in row[0]:
+            info['points'] = int(float(row[1]))
+        elif "Acquisition Date and Time:" in row[0]:
+            info['acquisition time'] = row[1].strip()
+            for dateFormat in ("%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+                try:
+                    info['acquisition time'] = datetime.datetime.strptime(info['acquisition time'], dateFormat)
+                    break
+                except ValueError:
+                    pass
+
+    # Files without multiplier preamble have a time column; derive the sample rate from its first step
+    if info['sample rate'] is None and len(firstRows) == 2 and len(firstRows[0]) > 1:
+        step = float(firstRows[1][0]) - float(firstRows[0][0])
+        if len(preamble) > 0 and '(s)' not in preamble[0]:
+            step = step*60
+        if step > 0:
+            info['sample rate'] = 1/step
+
+    # Fall back to the file modification time if the acquisition time is not in the preamble
+    if info['acquisition time'] is None:
+        info['acquisition time'] = datetime.datetime.fromtimestamp(os.path.getmtime(filePath))
+
+    return info
+
+
+# Scan all run files of a directory and return the manifest, ordered by concentration and run number. Each entry
+# has file, concentration, prefix, run, sample rate, points, length (s), multiplier and acquisition time; files that
+# could not be read have an 'error' entry instead of the metadata
+def scanDirectory(inputPath):
+    manifest = []
+
+    for file in os.listdir(inputPath):
+        if file.endswith((".txt", ".asc", ".dat")) and not file.startswith('simulated') and not 'READ' in os.path.splitext(file)[0]:
+            entry = {'file': file, 'path': "%s/%s" % (inputPath, file)}
+
+            try:
+                entry['concentration'], entry['prefix'], entry['run'] = parseRunName(file)
+                if file.endswith(".dat"):
+                    entry.update(scanDat(entry['path']))
+                else:
+                    entry.update(scanAscii(entry['path']))
+
+                if entry['sample rate']:
+                    entry['length'] = entry['points'] / entry['sample rate']
+                else:
+                    entry['length'] = None
+
+            except Exception as error:
+                entry['error'] = str(error)
+
+            manifest.append(entry)
+
+    return sorted(manifest, key=lambda entry: (entry.get('concentration', float('inf')), entry.get('run', 0), entry['file']))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_startup.py measures the startup time of prACTISed and checks
+# it against a time budget: importing the core modules (without the GUI)
+# and opening the GUI window. Each measurement runs in a fresh Python
+# process. Exits with 1 if a budget is exceeded or the core modules
+# load PySimpleGUI or a heavy dependency at import time
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Example:
+#     python practised_startup.py
+#     python practised_startup.py --core-budget 0.3 --window-budget 2
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+coreModules = ["practised_working", "practised_compensation", "practised_analysis", "practised_validate",
+               "practised_store", "practised_scan", "practised_pdfReport", "practised_notify", "practised_batch",
+               "practised_sweep", "practised_fit", "practised_bootstrap",
+               "practised_peaks"]
+
+# Must not be loaded by importing the core modules
+heavyModules = ["PySimpleGUI", "tkinter", "pandas", "numpy", "matplotlib", "scipy", "openpyxl", "fpdf", "PIL"]
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+
+# Code run first in every measurement: modules without .py extension (e.g. practised_compensation) are loaded from
+# the program directory (see practised_loader.py)
+importer = ("import sys\n"
+            "sys.path.insert(0, %r)\n"
+            "import practised_loader\n"
+            % directory)
+
+
+# Time to import the core modules in a fresh interpreter (without the interpreter startup itself) and the heavy
+# modules that were loaded on the way. Raises RuntimeError with the last line of the error output if a module cannot
+# be imported
+def measureCore():
+    code = (importer +
+            "import time, json\n"
+            "start = time.perf_counter()\n"
+            "import %s\n"
+            "elapsed = time.perf_counter() - start\n"
+            "print(json.dumps([elapsed, [name for name in %r if name in sys.modules]]))\n"
+            % (", ".join(coreModules), heavyModules))
+    result = subprocess.run([sys.executable, "-c", code], cwd=directory, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(lastLine(result))
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+# Time until the GUI window is shown; None if no window can be opened. practised.py is run with PySimpleGUI.Window
+# replaced by a subclass that closes the window and exits as soon as it is created, so the GUI itself has no hook
+def measureWindow():
+    code = (importer +
+            "import runpy, PySimpleGUI\n"
+            "class StartupWindow(PySimpleGUI.Window):\n"
+            "    def __init__(self, *args, **kwargs):\n"
+            "        super().__init__(*args, **kwargs)\n"
+            "        self.close()\n"
+            "        sys.exit(0)\n"
+            "PySimpleGUI.Window = StartupWindow\n"
+            "sys.argv = [%r]\n"
+            "runpy.run_path(sys.argv[0], run_name='__main__')\n"
+            % os.path.join(directory, "practised.py"))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=directory, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        return None, lastLine(result)
+    return elapsed, None
+
+
+# Last line of the error output of a measurement (e.g. the exception), or its exit code
+def lastLine(result):
+    if result.stderr.strip():
+        return result.stderr.strip().splitlines()[-1]
+    return "exit code %d" % result.returncode
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the startup time budget of prACTISed")
+    parser.add_argument("--core-budget", type=float, default=0.5,
+                        help="seconds allowed to import the core modules (default: 0.5)")
+    parser.add_argument("--window-budget", type=float, default=3.0,
+                        help="seconds allowed until the GUI window is shown (default: 3)")
+    parser.add_argument("--repeat", type=int, default=3, help="measurements, the fastest counts (default: 3)")
+    args = parser.parse_args(argv)
+
+    withinBudget = True
+
+    try:
+        core = [measureCore() for repeat in range(args.repeat)]
+    except RuntimeError as error:
+        print("Core import: failed (%s)" % error)
+        return 1
+
+    coreTime = min(measurement[0] for measurement in core)
+    loaded = sorted(set(name for measurement in core for name in measurement[1]))
+    print("Core import: %.3f s (budget %.3f s)" % (coreTime, args.core_budget))
+    if coreTime > args.core_budget:
+        withinBudget = False
+    if len(loaded) > 0:
+        print("Core import loads: %s" % ", ".join(loaded))
+        withinBudget = False
+
+    windows = [measureWindow() for repeat in range(args.repeat)]
+    windowTimes = [measurement[0] for measurement in windows if measurement[0] is not None]
+    if len(windowTimes) == 0:
+        print("Time to window: skipped (%s)" % windows[0][1])
+    else:
+        print("Time to window: %.3f s (budget %.3f s)" % (min(windowTimes), args.window_budget))
+        if min(windowTimes) > args.window_budget:
+            withinBudget = False
+
+    return 0 if withinBudget else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
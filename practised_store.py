@@ -0,0 +1,776 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_store.py reads and writes prACTISed working data, either as
+# an Excel working file (.xlsx) or as a binary working store, and
+# exports a working store to Excel
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# A working store is a directory ending in .practised with the same sheets
+# as the Excel working file:
+#
+# experiment.practised
+#       |-> manifest.json      <-- sheet order, column names of the data
+#       |                          sheets and all cells of the Inputs
+#       |                          and Outputs sheets
+#       |-> sheet2.npy         <-- one 2-D float array per data sheet
+#       |-> sheet3.npy             (P_simulated, concentrations)
+#       ...
+#
+# Both formats are accessed through WorkingData: the Inputs and Outputs
+# sheets are openpyxl worksheets in data.book (so cell(row, col) works as
+# before) and data sheets are read with data.sheet(name) as dataframes.
+# Opening working data only reads the Inputs and Outputs sheets; a data
+# sheet is read when it is first used (from its array file, or streamed
+# from the worksheet XML of an Excel working file into a float array).
+#
+# Only changed sheets are written on save(). In a working store these are
+# the arrays of changed data sheets (and the manifest); an Excel working
+# file is written anew with the Inputs and Outputs sheets (with their
+# formatting) and the changed data sheets, while the XML of all other
+# data sheets is copied through from the file on disk without parsing it,
+# keeping the styles of that file.
+
+# numpy, pandas and openpyxl are imported where they are used, so that importing this module stays fast
+
+import json
+import math
+import os
+import re
+
+storeSuffix = ".practised"
+manifestName = "manifest.json"
+
+# Namespaces of the workbook parts of an Excel file
+mainNamespace = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+relationshipNamespace = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+# True if path is a working store directory
+def isStore(path):
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, manifestName))
+
+
+# Sheets kept as cells (everything else is a numeric data sheet)
+def isCellSheet(name):
+    return name == "Inputs" or name.startswith("Outputs")
+
+
+# Values written to cells: numpy scalars as Python numbers, NaN as empty cell and infinity as text (as written by
+# pandas to_excel)
+def cellValue(value):
+    import numpy as np
+
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, float) and math.isinf(value):
+        return "inf" if value > 0 else "-inf"
+    return value
+
+
+# Write a dataframe into a worksheet (header in the first row) starting at column startcol
+def writeFrame(ws, df, startcol=1, float_format=None):
+    for col, name in enumerate(df.columns):
+        ws.cell(row=1, column=startcol + col).value = cellValue(name)
+
+    for row, values in enumerate(df.itertuples(index=False), start=2):
+        for col, value in enumerate(values):
+            value = cellValue(value)
+            if float_format is not None and isinstance(value, float):
+                value = float(float_format % value)
+            ws.cell(row=row, column=startcol + col).value = value
+
+
+# Rows of a dataframe for a write-only worksheet: the header, then the values as Python numbers (NaN as empty cell and
+# infinity as text, see cellValue). The columns are converted from their arrays in chunks of rows, so that a long sheet
+# is never held as cells
+def frameRows(df, chunk=10000):
+    import numpy as np
+
+    yield [cellValue(name) for name in df.columns]
+
+    columns = [df.iloc[:,col].to_numpy() for col in range(len(df.columns))]
+    for start in range(0, len(df), chunk):
+        values = []
+        for column in columns:
+            part = column[start:start + chunk]
+            if part.dtype.kind in "biu" or (part.dtype.kind == "f" and np.isfinite(part).all()):
+                values.append(part.tolist())
+            else:
+                values.append([cellValue(value) for value in part.tolist()])
+        yield from zip(*values)
+
+
+# Zip member names of the worksheet parts of an Excel file, by sheet name
+def sheetParts(archive):
+    import posixpath
+    import xml.etree.ElementTree as ET
+
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    relationships = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = dict((rel.get("Id"), rel.get("Target")) for rel in relationships)
+
+    parts = {}
+    for sheet in workbook.iter("{%s}sheet" % mainNamespace):
+        target = targets[sheet.get("{%s}id" % relationshipNamespace)]
+        if target.startswith("/"):
+            parts[sheet.get("name")] = target[1:]
+        else:
+            parts[sheet.get("name")] = posixpath.normpath(posixpath.join("xl", target))
+    return parts
+
+
+# Shared strings of an Excel file (texts of all runs of rich text strings joined)
+def sharedStrings(archive):
+    import xml.etree.ElementTree as ET
+
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+
+    strings = []
+    for item in ET.fromstring(archive.read("xl/sharedStrings.xml")):
+        texts = item.findall("{%s}t" % mainNamespace) + item.findall("{%s}r/{%s}t" % (mainNamespace, mainNamespace))
+        strings.append("".join(text.text or "" for text in texts))
+    return strings
+
+
+sharedStringCell = re.compile(rb'<c\b([^>]*?) t="s"([^>]*)>\s*<v>(\d+)</v>\s*</c>')
+
+# Lists of styles.xml in the order of the schema, with the element of their items
+styleLists = [(b"numFmts", b"numFmt"), (b"fonts", b"font"), (b"fills", b"fill"), (b"borders", b"border"),
+              (b"cellStyleXfs", b"xf"), (b"cellXfs", b"xf"), (b"cellStyles", b"cellStyle"), (b"dxfs", b"dxf"),
+              (b"tableStyles", b"tableStyle"), (b"colors", None), (b"extLst", None)]
+styleReference = re.compile(rb'\b(numFmtId|fontId|fillId|borderId|xfId)="(\d+)"')
+numberFormat = re.compile(rb'\bnumFmtId="(\d+)"[^>]*?\bformatCode="([^"]*)"')
+cellStyleIndex = re.compile(rb'(<(?:c|row)\b[^>]*? s=")(\d+)"')
+columnStyleIndex = re.compile(rb'(<col\b[^>]*? style=")(\d+)"')
+differentialFormatId = re.compile(rb'\bdxfId="(\d+)"')
+
+
+# Make worksheet XML independent of the shared strings of the workbook it comes from: they become inline strings.
+# References to styles are kept, the styles of that workbook are kept as well (see mergeStyles)
+def detachCells(xml, strings):
+    from xml.sax.saxutils import escape
+
+    def inline(match):
+        text = escape(strings[int(match.group(3))]).encode("utf-8")
+        return b'<c%s t="inlineStr"%s><is><t xml:space="preserve">%s</t></is></c>' % (match.group(1), match.group(2),
+                                                                                      text)
+
+    # Plain search first: most blocks of a data sheet have no text
+    if b' t="s"' in xml:
+        xml = sharedStringCell.sub(inline, xml)
+    return xml
+
+
+# Stream a worksheet part from one zip file into another, detached from its workbook (see detachCells). It is read in
+# blocks that are cut after the last complete row, so that a large sheet is never held in memory
+def copySheetPart(source, target, strings):
+    pending = b""
+    for block in iter(lambda: source.read(1024*1024), b""):
+        pending += block
+        end = pending.rfind(b"</row>")
+        if end >= 0:
+            end += len(b"</row>")
+            target.write(detachCells(pending[:end], strings))
+            pending = pending[end:]
+    target.write(detachCells(pending, strings))
+
+
+# A list of styles.xml (e.g. fonts): match of the list element and its items; None if it is missing
+def styleList(styles, name, item):
+    found = re.search(rb'<%s\b([^>]*?)(?:/>|>(.*?)</%s>)' % (name, name), styles, re.S)
+    if found is None:
+        return None, []
+    return found, re.findall(rb'<%s\b(?:[^>]*?/>|.*?</%s>)' % (item, item), found.group(2) or b"", re.S)
+
+
+# styles.xml with the list name holding items; a missing list is inserted where the schema order puts it
+def replaceStyleList(styles, name, items):
+    found, present = styleList(styles, name, dict(styleLists)[name])
+    attributes = re.sub(rb'\s*\bcount="\d*"', b"", found.group(1)) if found is not None else b""
+    element = b'<%s count="%d"%s>%s</%s>' % (name, len(items), attributes, b"".join(items), name)
+    if found is not None:
+        return styles[:found.start()] + element + styles[found.end():]
+
+    names = [listName for listName, item in styleLists]
+    for later in names[names.index(name) + 1:]:
+        position = re.search(rb'<%s\b' % later, styles)
+        if position is not None:
+            return styles[:position.start()] + element + styles[position.start():]
+    end = styles.rfind(b"</styleSheet>")
+    return styles[:end] + element + styles[end:]
+
+
+# Merge the styles of a new workbook into the styles of the workbook sheets are copied from, so that the copied sheets
+# keep their style indices unchanged: the number formats, fonts, fills, borders, cell formats and differential formats
+# of the new workbook are appended (unless the same item is there already). Returns the merged styles and the new
+# indices of the cell formats and differential formats of the new workbook (see restyleCells); None if the source
+# styles cannot be merged (e.g. elements with a namespace prefix)
+def mergeStyles(styles, sourceStyles):
+    if not re.search(rb'<styleSheet\b', sourceStyles) or b"</styleSheet>" not in sourceStyles:
+        return None
+
+    merged = sourceStyles
+    indices = {}
+
+    # Number formats are referenced by id (from 164 on for formats of the workbook), not by position
+    present = styleList(merged, b"numFmts", b"numFmt")[1]
+    ids = dict((code, int(number)) for item in present for number, code in numberFormat.findall(item))
+    formatIds = {}
+    added = []
+    for item in styleList(styles, b"numFmts", b"numFmt")[1]:
+        for number, code in numberFormat.findall(item):
+            if code not in ids:
+                ids[code] = max(list(ids.values()) + [163]) + 1
+                added.append(item.replace(b'numFmtId="%s"' % number, b'numFmtId="%d"' % ids[code]))
+            formatIds[number] = b"%d" % ids[code]
+    if len(added) > 0:
+        merged = replaceStyleList(merged, b"numFmts", present + added)
+
+    # References of an item to the lists merged before. openpyxl keeps the xfId of cell formats it read, even if it
+    # writes fewer cell style formats, so references past the end of a list are taken as its first item (Normal)
+    def reindex(item, lists):
+        def reference(match):
+            name = match.group(1)
+            if name == b"numFmtId":
+                number = formatIds.get(match.group(2), match.group(2))
+            else:
+                mapping = lists[name]
+                index = int(match.group(2))
+                number = b"%d" % (mapping[index] if index < len(mapping) else mapping[0] if mapping else 0)
+            return b'%s="%s"' % (name, number)
+        return styleReference.sub(reference, item)
+
+    for name, item, key in [(b"fonts", b"font", b"fontId"), (b"fills", b"fill", b"fillId"),
+                            (b"borders", b"border", b"borderId"), (b"cellStyleXfs", b"xf", b"xfId"),
+                            (b"cellXfs", b"xf", None), (b"dxfs", b"dxf", None)]:
+        found, present = styleList(merged, name, item)
+        if found is None and re.search(rb'<\w+:%s\b' % name, merged):
+            return None
+
+        positions = {}
+        for position, existing in enumerate(present):
+            positions.setdefault(existing, position)
+        mapping = []
+        added = []
+        for own in styleList(styles, name, item)[1]:
+            own = reindex(own, indices)
+            if own not in positions:
+                positions[own] = len(present) + len(added)
+                added.append(own)
+            mapping.append(positions[own])
+        if len(added) > 0:
+            merged = replaceStyleList(merged, name, present + added)
+        indices[key or name] = mapping
+
+    return merged, indices[b"cellXfs"], indices[b"dxfs"]
+
+
+# Worksheet XML written with the styles of a new workbook, with its style indices changed to those of the merged styles
+# (see mergeStyles): cell formats of cells, rows and columns and differential formats of conditional formatting
+def restyleCells(xml, cellFormats, differentialFormats):
+    def renumber(mapping):
+        return lambda match: match.group(1) + b'%d"' % mapping[int(match.group(2))]
+
+    xml = cellStyleIndex.sub(renumber(cellFormats), xml)
+    xml = columnStyleIndex.sub(renumber(cellFormats), xml)
+    return differentialFormatId.sub(lambda match: b'dxfId="%d"' % differentialFormats[int(match.group(1))], xml)
+
+
+# Data sheets of an Excel file that can be copied through: sheet name and zip member of its worksheet part, for all
+# names given that have a plain worksheet part (no relationships of its own, e.g. drawings or tables)
+def copyableSheets(path, names):
+    import zipfile
+    import xml.etree.ElementTree as ET
+
+    if not zipfile.is_zipfile(path):
+        return {}
+
+    try:
+        with zipfile.ZipFile(path) as archive:
+            members = set(archive.namelist())
+            parts = sheetParts(archive)
+    except (KeyError, ET.ParseError, zipfile.BadZipFile):
+        return {}
+
+    copyable = {}
+    for name in names:
+        part = parts.get(name)
+        if part in members and "%s/_rels/%s.rels" % tuple(part.rsplit("/", 1)) not in members:
+            copyable[name] = part
+    return copyable
+
+
+numberCell = re.compile(rb'<c r="([A-Z]+)(\d+)"(?: t="n")?><v>([^<]*)</v></c>')
+anyCell = re.compile(rb'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+cellReference = re.compile(rb'\br="([A-Z]+)(\d+)"')
+cellType = re.compile(rb'\bt="(\w+)"')
+cellNumber = re.compile(rb'<v>([^<]*)</v>')
+cellText = re.compile(rb'<t\b[^>]*>([^<]*)</t>')
+prefixedCell = re.compile(rb'<\w+:(?:row|c)\b')
+
+
+# Value of a cell that is not a plain number (see readSheetPart): text (shared or inline strings, formula results),
+# booleans and numbers with a style or formula; None for empty cells and errors
+def cellContent(attributes, content, strings):
+    import html
+
+    kind = cellType.search(attributes)
+    kind = kind.group(1) if kind is not None else b"n"
+    if kind == b"inlineStr":
+        return html.unescape(b"".join(cellText.findall(content or b"")).decode("utf-8"))
+
+    number = cellNumber.search(content or b"")
+    if number is None or kind == b"e":
+        return None
+    text = html.unescape(number.group(1).decode("utf-8"))
+    if kind == b"s":
+        return strings[int(text)]
+    if kind == b"b":
+        return text == "1"
+    if kind in (b"str", b"d"):
+        return text
+    return float(text) if "." in text or "e" in text or "E" in text else int(text)
+
+
+# Read the worksheet part of a data sheet into its header (the values of the first row, numbers as int or float as
+# openpyxl reads them) and a float array of all other rows. Plain numeric cells are parsed in bulk; text is NaN, except
+# inf and -inf (as written by cellValue). The part is read in blocks cut after the last complete row, and the array is
+# sized from the cells read (not from the dimension the sheet claims). Returns None for sheets this reader does not
+# handle (cells without reference or with a namespace prefix such as <x:c>, or no cells found at all), to be read with
+# openpyxl instead
+def readSheetPart(source, strings):
+    import numpy as np
+    from openpyxl.utils import column_index_from_string
+
+    indexes = {}
+    header = {}
+    values = np.full((0, 0), np.nan)
+    parsed = False
+
+    def index(letters):
+        if letters not in indexes:
+            indexes[letters] = column_index_from_string(letters.decode()) - 1
+        return indexes[letters]
+
+    # Make the array large enough for rows (1-based sheet row numbers) and columns (0-based), growing it by doubling
+    def grow(rows, cols):
+        nonlocal values
+        if rows - 1 > values.shape[0] or cols + 1 > values.shape[1]:
+            larger = np.full((max(rows - 1, 2*values.shape[0]), max(cols + 1, values.shape[1])), np.nan)
+            larger[:values.shape[0], :values.shape[1]] = values
+            values = larger
+
+    def parse(xml):
+        nonlocal parsed
+        # Plain numbers: references and values converted in bulk
+        numbers = numberCell.findall(xml)
+        if len(numbers) > 0:
+            letters, rows, texts = zip(*numbers)
+            for letter in set(letters):
+                index(letter)
+            cols = np.fromiter(map(indexes.__getitem__, letters), dtype=np.int64, count=len(letters))
+            rows = np.fromstring(b" ".join(rows), dtype=np.int64, sep=" ")
+            numbers = np.fromstring(b" ".join(texts), dtype=float, sep=" ")
+            if len(numbers) != len(texts):
+                numbers = np.array([float(text) if len(text) > 0 else np.nan for text in texts])
+            grow(rows.max(), cols.max())
+            parsed = True
+            data = rows > 1
+            values[rows[data] - 2, cols[data]] = numbers[data]
+            for n in np.flatnonzero(~data):
+                text = texts[n].decode()
+                header[cols[n]] = float(text) if "." in text or "e" in text or "E" in text else int(text)
+
+            # Done if there are no other cells; they are parsed one by one
+            if xml.count(b"<c ") + xml.count(b"<c>") == len(numbers):
+                return True
+            xml = numberCell.sub(b"", xml)
+
+        for attributes, content in anyCell.findall(xml):
+            reference = cellReference.search(attributes)
+            if reference is None:
+                return False
+            col, row = index(reference.group(1)), int(reference.group(2))
+            parsed = True
+            value = cellContent(attributes, content, strings)
+            if row == 1:
+                header[col] = value
+            elif value is not None:
+                if isinstance(value, str):
+                    value = {"inf": np.inf, "-inf": -np.inf}.get(value, np.nan)
+                grow(row, col)
+                values[row - 2, col] = value
+        return True
+
+    pending = b""
+    for block in iter(lambda: source.read(1024*1024), b""):
+        if b":" in block and prefixedCell.search(block):
+            return None
+        pending += block
+        end = pending.rfind(b"</row>")
+        if end >= 0:
+            end += len(b"</row>")
+            if not parse(pending[:end]):
+                return None
+            pending = pending[end:]
+    if not parse(pending) or not parsed:
+        return None
+
+    # Rows up to the last one with a value (the array grows in steps); the header covers all columns
+    used = np.flatnonzero(~np.all(np.isnan(values), axis=1))
+    cols = max([values.shape[1]] + [col + 1 for col in header])
+    grow(0, cols - 1)
+    values = values[:used[-1] + 1 if len(used) > 0 else 0, :cols]
+    return [header.get(col) for col in range(cols)], values
+
+
+# Write a dataframe as worksheet XML: the header, then the rows of frameRows (numbers, text as inline strings, empty
+# cells left out), written a chunk of rows at a time
+def writeSheetXML(target, df, chunk=10000):
+    from openpyxl.utils import get_column_letter
+    from xml.sax.saxutils import escape
+
+    def cell(letter, number, value):
+        if isinstance(value, bool):
+            return '<c r="%s%d" t="b"><v>%d</v></c>' % (letter, number, value)
+        if isinstance(value, (int, float)):
+            return '<c r="%s%d"><v>%r</v></c>' % (letter, number, value)
+        return '<c r="%s%d" t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % (letter, number,
+                                                                                       escape(str(value)))
+
+    letters = [get_column_letter(col) for col in range(1, len(df.columns) + 1)]
+    dimension = "A1:%s%d" % (letters[-1], len(df) + 1) if len(letters) > 0 else "A1"
+    target.write(('<worksheet xmlns="%s"><dimension ref="%s"/><sheetData>' % (mainNamespace, dimension)).encode())
+
+    rows = []
+    for number, row in enumerate(frameRows(df, chunk), start=1):
+        rows.append('<row r="%d">%s</row>' % (number, "".join(cell(letter, number, value)
+                                                             for letter, value in zip(letters, row)
+                                                             if value is not None)))
+        if len(rows) == chunk:
+            target.write("".join(rows).encode("utf-8"))
+            rows = []
+    target.write(("".join(rows) + "</sheetData></worksheet>").encode("utf-8"))
+
+
+# Save the zip file written as path with the (empty) worksheet parts of the data sheets filled in: the sheets in names
+# are written from frame(name), the copied sheets (sheet name and worksheet part) are streamed from the file source.
+# With copied sheets the styles of source are kept and the styles of the written file merged into them (see
+# mergeStyles); if they cannot be merged, the copied sheets are written from frame(name) as well
+def mergeSheets(written, path, frame, names, source=None, copied=None):
+    import zipfile
+
+    if copied is None:
+        copied = {}
+
+    temp = "%s.%d.merge" % (path, os.getpid())
+    try:
+        with zipfile.ZipFile(written) as new, zipfile.ZipFile(temp, "w", zipfile.ZIP_DEFLATED) as merged:
+            old = zipfile.ZipFile(source) if len(copied) > 0 else None
+            try:
+                strings = sharedStrings(old) if old is not None else []
+                sheets = dict((part, name) for name, part in sheetParts(new).items())
+
+                styles = None
+                if old is not None:
+                    if "xl/styles.xml" in old.namelist():
+                        styles = mergeStyles(new.read("xl/styles.xml"), old.read("xl/styles.xml"))
+                    if styles is None:
+                        names = set(names) | set(copied)
+                        copied = {}
+
+                for member in new.infolist():
+                    name = sheets.get(member.filename)
+                    if name in copied:
+                        with old.open(copied[name]) as sheet, \
+                                merged.open(member.filename, "w", force_zip64=True) as target:
+                            copySheetPart(sheet, target, strings)
+                    elif name in names:
+                        with merged.open(member.filename, "w", force_zip64=True) as target:
+                            writeSheetXML(target, frame(name))
+                    elif styles is not None and member.filename == "xl/styles.xml":
+                        merged.writestr(member, styles[0])
+                    elif styles is not None and name is not None:
+                        merged.writestr(member, restyleCells(new.read(member.filename), styles[1], styles[2]))
+                    else:
+                        merged.writestr(member, new.read(member.filename))
+            finally:
+                if old is not None:
+                    old.close()
+
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+class WorkingData:
+
+    def __init__(self, path):
+        self.path = path
+        self.store = path.endswith(storeSuffix) or isStore(path)
+        self.book = None
+        self.order = []
+        self.columns = {}
+        self.files = {}
+        self.tables = {}
+        self.frames = {}
+        self.changed = set()
+        self.parts = None
+        self.strings = None
+
+    # Names of all sheets in order
+    @property
+    def sheetnames(self):
+        return list(self.order)
+
+    # Read a data sheet as dataframe. Each sheet is parsed only once (from its array file, or streamed from the Excel
+    # working file) and kept in memory; callers get a copy
+    def sheet(self, name):
+        import numpy as np
+        import pandas as pd
+
+        if name in self.tables:
+            return self.tables[name].copy()
+
+        if name not in self.frames:
+            if self.store:
+                if name not in self.files:
+                    raise KeyError("Worksheet %s does not exist." % name)
+                self.frames[name] = pd.DataFrame(np.load(os.path.join(self.path, self.files[name])),
+                                                 columns=self.columns[name])
+            else:
+                self.frames[name] = self.readSheet(name)
+
+        return self.frames[name].copy()
+
+    # Read a data sheet of the Excel working file into a dataframe of floats (see readSheetPart); the worksheet parts
+    # and shared strings of the file are looked up once
+    def readSheet(self, name):
+        import zipfile
+        import pandas as pd
+
+        with zipfile.ZipFile(self.path) as archive:
+            if self.parts is None:
+                self.parts = sheetParts(archive)
+                self.strings = sharedStrings(archive)
+            if name not in self.parts or isCellSheet(name):
+                raise KeyError("Worksheet %s does not exist." % name)
+            with archive.open(self.parts[name]) as part:
+                sheet = readSheetPart(part, self.strings)
+
+        if sheet is None:
+            from openpyxl import load_workbook
+
+            book = load_workbook(self.path, read_only=True, data_only=True)
+            try:
+                rows = book[name].values
+                header = next(rows, ())
+                return pd.DataFrame(list(rows), columns=header).infer_objects()
+            finally:
+                book.close()
+
+        header, values = sheet
+        return pd.DataFrame(values, columns=header)
+
+    # Read several data sheets at once, without blank rows, as dictionary of sheet name and dataframe
+    def dataset(self, names):
+        return dict((name, self.sheet(name).dropna(how='all')) for name in names)
+
+    # Replace (or add) a data sheet; written on save()
+    def setSheet(self, name, df):
+        self.tables[name] = df
+        self.changed.add(name)
+        if name not in self.order:
+            self.order.append(name)
+
+    # Add an empty cell sheet (e.g. Outputs); a cell sheet of the same title is replaced in its place, so that running
+    # the analysis again gives the same working file
+    def createSheet(self, title):
+        if title in self.book.sheetnames:
+            position = self.book.sheetnames.index(title)
+            self.book.remove(self.book[title])
+            return self.book.create_sheet(title, position)
+
+        ws = self.book.create_sheet(title)
+        self.order.append(ws.title)
+        return ws
+
+    # Write all changes back to the working file or store
+    def save(self):
+        if self.store:
+            self.saveStore()
+        else:
+            self.saveWorkbook()
+        self.changed = set()
+
+    # Dataframe of a data sheet as it is to be written (not a copy)
+    def frame(self, name):
+        if name in self.tables:
+            return self.tables[name]
+        return self.sheet(name)
+
+    # Write the Excel working file: the worksheet parts of unchanged data sheets are copied from the file on disk, all
+    # other sheets are written
+    def saveWorkbook(self):
+        untouched = [name for name in self.sheetnames if not isCellSheet(name) and name not in self.changed]
+        copied = copyableSheets(self.path, untouched) if os.path.exists(self.path) else {}
+        self.writeWorkbook(self.path, copied)
+
+        # The parts of the file written are numbered anew (sheets read before are kept in memory)
+        self.parts = None
+        self.strings = None
+
+    # Write all sheets as Excel file to path: Inputs and Outputs with openpyxl (with their formatting), data sheets as
+    # worksheet XML straight from their arrays, except the copied sheets (sheet name and worksheet part), which are
+    # taken from the Excel working file on disk. Written into a temporary file first and moved over path
+    def writeWorkbook(self, path, copied=None):
+        if copied is None:
+            copied = {}
+
+        # Data sheets are empty worksheets in the book, filled in by mergeSheets
+        for position, name in enumerate(self.sheetnames):
+            if name not in self.book.sheetnames:
+                self.book.create_sheet(name)
+            self.book.move_sheet(name, position - self.book.sheetnames.index(name))
+
+        names = set(name for name in self.sheetnames if not isCellSheet(name) and name not in copied)
+        temp = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            self.book.save(temp)
+            mergeSheets(temp, path, self.frame, names, self.path, copied)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def saveStore(self):
+        import numpy as np
+
+        os.makedirs(self.path, exist_ok=True)
+
+        for name in self.changed:
+            if name not in self.files:
+                self.files[name] = "sheet%d.npy" % (len(self.files) + 2)
+            self.columns[name] = [str(col) for col in self.tables[name].columns]
+            np.save(os.path.join(self.path, self.files[name]), self.tables[name].to_numpy(dtype=float))
+
+        sheets = []
+        for name in self.order:
+            if isCellSheet(name):
+                ws = self.book[name]
+                cells = [[cell.row, cell.column, cell.value] for row in ws.iter_rows() for cell in row
+                         if cell.value is not None]
+                sheets.append({'name': name, 'cells': cells})
+            else:
+                sheets.append({'name': name, 'file': self.files[name], 'columns': self.columns[name]})
+
+        # Write manifest last and atomically, so that a store is never left pointing to missing arrays
+        temp = os.path.join(self.path, manifestName + ".tmp")
+        with open(temp, "w", encoding="utf-8") as manifest:
+            json.dump({'version': 1, 'sheets': sheets}, manifest, ensure_ascii=False)
+        os.replace(temp, os.path.join(self.path, manifestName))
+
+    # Write everything to an Excel working file (e.g. as final step after working with a store)
+    def export(self, xlsxPath):
+        self.writeWorkbook(xlsxPath)
+        return xlsxPath
+
+
+# Empty worksheet standing in for a data sheet in the workbook of cellBook
+emptySheet = ('<worksheet xmlns="%s"><sheetData/></worksheet>' % mainNamespace).encode()
+
+
+# The workbook of an Excel working file with its formatting (number formats, column widths, data validation, cell
+# styles), in which only the Inputs and Outputs sheets are parsed: openpyxl loads a copy in memory with empty data sheets
+def cellBook(path):
+    import io
+    import zipfile
+    import xml.etree.ElementTree as ET
+    from openpyxl import load_workbook
+
+    reduced = io.BytesIO()
+    with zipfile.ZipFile(path) as archive, zipfile.ZipFile(reduced, "w") as target:
+        try:
+            data = set(part for name, part in sheetParts(archive).items() if not isCellSheet(name))
+        except (KeyError, ET.ParseError):
+            data = set()
+        for member in archive.infolist():
+            target.writestr(member.filename, emptySheet if member.filename in data else archive.read(member.filename))
+
+    return load_workbook(reduced, data_only=True)
+
+
+# Open an existing working file (.xlsx) or working store
+def openWorkingData(path):
+    from openpyxl import Workbook
+
+    data = WorkingData(path)
+
+    if data.store:
+        with open(os.path.join(path, manifestName), encoding="utf-8") as manifest:
+            sheets = json.load(manifest)['sheets']
+
+        data.book = Workbook()
+        data.book.remove(data.book.active)
+        for sheet in sheets:
+            data.order.append(sheet['name'])
+            if 'cells' in sheet:
+                ws = data.book.create_sheet(sheet['name'])
+                for row, col, value in sheet['cells']:
+                    ws.cell(row=row, column=col).value = value
+            else:
+                data.files[sheet['name']] = sheet['file']
+                data.columns[sheet['name']] = sheet['columns']
+
+    # Excel working file: only the Inputs and Outputs sheets are parsed (see cellBook), data sheets are read by sheet()
+    else:
+        data.book = cellBook(path)
+        data.order = list(data.book.sheetnames)
+
+    return data
+
+
+# Create empty working data (only an empty Inputs sheet) that is written to path on save(); a path ending in
+# .practised gives a working store, otherwise an Excel working file
+def newWorkingData(path):
+    from openpyxl import Workbook
+
+    data = WorkingData(path)
+    data.book = Workbook()
+    data.book.active.title = "Inputs"
+    data.order.append("Inputs")
+    return data
+
+
+# Read the last cell sheet (Outputs) the way the GUI and report show it: the A:B (inputs), D:J (summary) and L (Kd and
+# statistics) columns as lists of rows; empty summary and Kd rows are dropped, empty cells are NaN
+def readOutputs(path):
+    ws = [ws for ws in openWorkingData(path).book.worksheets if isCellSheet(ws.title)][-1]
+
+    def block(firstCol, lastCol, dropEmpty):
+        rows = []
+        for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=firstCol, max_col=lastCol, values_only=True):
+            if dropEmpty and all(value is None for value in row):
+                continue
+            rows.append([float('nan') if value is None else value for value in row])
+        return rows
+
+    return {'inputs': block(1, 2, False), 'summary': block(4, 10, True), 'kd': block(12, 12, True)}
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# practised_sweep.py shows how robust the Kd of a working file (or
+# working store) is to the choices made for the analysis: the window
+# width (Inputs B15) and the [P]0 used to determine the peak
+# programmatically (B18). The concentration data is read once and the
+# Kd ± error, R² and χ² of every combination are calculated from it,
+# optionally in worker processes, without changing the working file.
+# The results are written as sensitivity table and graph
+
+# Copyright (C) 2022  Jessica Latimer
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Window widths and [P]0 are given as comma separated values and ranges
+# start:stop:step (stop included). With manually determined peaks (B16
+# "M") only the window width is swept.
+#
+# Example:
+#     python practised_sweep.py experiment.xlsx --widths 0:10:0.5 --peak-concs all
+#     python practised_sweep.py experiment.xlsx --widths 1,2,5 --peak-concs 0.5,1 -o sweep.json -j 4
+
+import argparse
+import csv
+import json
+import os
+import sys
+import traceback
+
+sweepColumns = ["window width (%)", "peak conc", "Kd", "Kd error", "unit", "R²", "χ²", "status", "error"]
+
+# Sweep data of a worker process (set once by initWorker)
+workerData = None
+
+
+# Values of a comma separated list of numbers and ranges start:stop:step (stop included)
+def parseValues(spec):
+    values = []
+    for item in spec.split(","):
+        if ":" in item:
+            start, stop, step = [float(part) for part in item.split(":")]
+            values += [round(start + step*k, 10) for k in range(int(round((stop - start)/step)) + 1)]
+        else:
+            values.append(float(item))
+    return sorted(set(values))
+
+
+# Read the inputs and concentration data of a working file or store once: the time index and the runs (time x runs) of
+# every concentration, and the peak times that do not depend on the window width. The window averages are cached in
+# the data by concentration, peak time and window width (different [P]0 often give the same peak time). peakFinder
+# selects how the peak is determined programmatically, see practised_peaks.referencePeakTime
+def loadSweepData(fileName, peakFinder="maximum"):
+    import pathlib
+    from practised_store import openWorkingData, isStore
+    from practised_notify import PractisedError
+    from practised_peaks import TimeIndex, referencePeakTime
+
+    if not pathlib.Path(fileName).is_file() and not isStore(fileName):
+        raise PractisedError("Given file '%s' is not a file or does not exist." % fileName)
+
+    workingData = openWorkingData(fileName)
+    if "Inputs" not in workingData.sheetnames:
+        raise PractisedError("Input file Formatting Error: %s has no Inputs sheet." % fileName)
+
+    idealSheet = workingData.book["Inputs"]
+    numberOfConcs = int(idealSheet.cell(10,2).value)
+    concentrations = [idealSheet.cell(x,5).value for x in range(1,numberOfConcs+1)]
+    dataset = workingData.dataset(concentrations)
+
+    data = {'concentrations': concentrations,
+            'values': [float(conc.partition(" ")[0]) for conc in concentrations],
+            'unit': concentrations[0].partition(" ")[2],
+            'time index': [TimeIndex(dataset[conc]['raw time'], float(idealSheet.cell(3,2).value))
+                           for conc in concentrations],
+            'signals': [dataset[conc].iloc[:,1:].to_numpy(dtype=float) for conc in concentrations],
+            'injection time': float(idealSheet.cell(3,2).value),
+            'ligand conc': float(idealSheet.cell(11,2).value),
+            'peak det': str(idealSheet.cell(16,2).value),
+            'window width': float(idealSheet.cell(15,2).value),
+            'peak conc': None,
+            'window cache': {}}
+
+    # Programmatic peak: peak time of the runs at every concentration (each can be the [P]0 reference)
+    if data['peak det'] == "P":
+        data['peak conc'] = float(idealSheet.cell(18,2).value)
+        data['peak times'] = dict((value, referencePeakTime(timeIndex, signals, peakFinder))
+                                  for value, timeIndex, signals in zip(data['values'], data['time index'],
+                                                                       data['signals']))
+
+    # Manual peaks: the raw time before the given time for every concentration (as in dataanalysis)
+    elif data['peak det'] == "M":
+        manualTimes = idealSheet.cell(17,2).value.split(",")
+        data['manual peaks'] = [timeIndex.rawTimeBefore(manualTimes[x])
+                                for x, timeIndex in enumerate(data['time index'])]
+
+    else:
+        raise PractisedError("Unknown determination of peak '%s' in %s." % (data['peak det'], fileName))
+
+    return data
+
+
+# Kd ± error, R² and χ² for one window width (%) and [P]0 reference (None for manual peaks); weighted weights the fit
+# by the R standard deviations. Failures are returned in the result instead of raised
+def sweepPoint(data, width, peakConc, weighted=False):
+    import warnings
+    import numpy as np
+    from practised_analysis import windowAverages, rValues
+    from practised_fit import fitIsotherm
+
+    result = dict((column, None) for column in sweepColumns)
+    result.update({"window width (%)": width, "peak conc": peakConc, "unit": data['unit']})
+
+    try:
+        if data['peak det'] == "P":
+            peakTimes = [data['peak times'][peakConc]] * len(data['values'])
+            first = sum(value < peakConc for value in data['values'])
+        else:
+            peakTimes = data['manual peaks']
+            first = 0
+
+        windowCache = data['window cache']
+        signal = []
+        stddev = []
+        for x, peakTime in enumerate(peakTimes):
+            key = (x, peakTime, width)
+            if key not in windowCache:
+                timeIndex = data['time index'][x]
+                windows = windowAverages(timeIndex.time, data['signals'][x], data['injection time'], peakTime,
+                                         width/100, timeIndex)
+                if windows is None:
+                    raise ValueError("No time %s found in %s" % (peakTime, data['concentrations'][x]))
+                windowCache[key] = (windows['mean'], windows['std'])
+            signal.append(windowCache[key][0])
+            stddev.append(windowCache[key][1])
+
+        with warnings.catch_warnings(), np.errstate(all='ignore'):
+            warnings.simplefilter("ignore")
+            Rvalue, Rstddev = rValues(signal, stddev, first)
+            Kd, error, r_squared, chiSquared = fitIsotherm(data['values'][first:], Rvalue, data['ligand conc'],
+                                                           Rstddev if weighted else None)
+
+        result.update({"Kd": Kd, "Kd error": error, "R²": r_squared, "χ²": chiSquared, "status": "ok"})
+
+    except Exception as error:
+        result["status"] = "failed"
+        result["error"] = "".join(traceback.format_exception_only(type(error), error)).strip()
+
+    return result
+
+
+def initWorker(data):
+    global workerData
+    workerData = data
+
+
+def workerPoint(point):
+    return sweepPoint(workerData, *point)
+
+
+# Results for all combinations of window widths and [P]0 references (ignored for manual peaks), by [P]0 and then
+# width. workers is the number of processes, 1 calculates in this process and None uses all cores
+def sweep(data, widths, peakConcs=None, workers=1, weighted=False):
+    from concurrent.futures import ProcessPoolExecutor
+
+    if data['peak det'] != "P" or not peakConcs:
+        peakConcs = [data['peak conc']]
+    points = [(width, peakConc, weighted) for peakConc in peakConcs for width in widths]
+
+    if workers == 1 or len(points) <= 1:
+        return [sweepPoint(data, *point) for point in points]
+
+    # The data is sent to every worker once; the points are handed out in chunks
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(data,)) as pool:
+        chunksize = max(1, len(points) // (4 * (workers or os.cpu_count() or 1)))
+        return list(pool.map(workerPoint, points, chunksize=chunksize))
+
+
+# Spread of the Kd over the sweep relative to the Kd ± error of the working file's own inputs (reference)
+def robustness(results, reference):
+    import numpy as np
+
+    Kd = np.array([result["Kd"] for result in results if result["status"] == "ok"])
+    summary = {"points": len(results), "ok": len(Kd)}
+    if len(Kd) == 0:
+        return summary
+
+    summary.update({"Kd min": float(Kd.min()), "Kd median": float(np.median(Kd)), "Kd max": float(Kd.max()),
+                    "relative spread (%)": float((Kd.max() - Kd.min()) / abs(np.median(Kd)) * 100)})
+    if reference["status"] == "ok":
+        within = np.abs(Kd - reference["Kd"]) <= reference["Kd error"]
+        summary["within reference error (%)"] = float(np.mean(within) * 100)
+    return summary
+
+
+# Write the sensitivity table as JSON (.json) or CSV (any other extension)
+def writeSweep(results, outputPath):
+    if outputPath.endswith(".json"):
+        with open(outputPath, "w", encoding="utf-8") as output:
+            json.dump(results, output, ensure_ascii=False, indent=1)
+    else:
+        with open(outputPath, "w", encoding="utf-8", newline="") as output:
+            writer = csv.DictWriter(output, fieldnames=sweepColumns)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+# Graph of Kd ± error against the window width, one line per [P]0 reference (see practised_graphs.renderSensitivity)
+def sensitivityGraph(results, reference, graphPath):
+    import math
+
+    lines = []
+    for peakConc in sorted(set(result["peak conc"] for result in results), key=lambda value: (value is None, value)):
+        row = [result for result in results if result["peak conc"] == peakConc]
+        Kd = [result["Kd"] if result["status"] == "ok" else math.nan for result in row]
+        error = [result["Kd error"] if result["status"] == "ok" and math.isfinite(result["Kd error"]) else math.nan
+                 for result in row]
+        label = "Manual peaks" if peakConc is None else "Peak at %g %s" % (peakConc, reference["unit"])
+        lines.append(([result["window width (%)"] for result in row], Kd, error, label))
+
+    return {'kind': 'sensitivity', 'path': graphPath, 'lines': lines,
+            'reference': reference["Kd"] if reference["status"] == "ok" else None,
+            'ylabel': r'K$\mathbf{_d}$ (%s)' % reference["unit"]}
+
+
+def main(argv=None):
+    from practised_notify import PractisedError
+    from practised_graphs import renderGraph
+
+    parser = argparse.ArgumentParser(description="Sensitivity of the prACTISed Kd to the window width and peak reference")
+    parser.add_argument("workingFile", help="working file (.xlsx) or working store (.practised)")
+    parser.add_argument("--widths", default="0:10:0.5",
+                        help="window widths in %%, values and ranges start:stop:step (default: 0:10:0.5)")
+    parser.add_argument("--peak-concs", default="all",
+                        help="[P]0 references to determine the peak, values and ranges or 'all' concentrations "
+                             "(default: all)")
+    parser.add_argument("-o", "--output", help="sensitivity table, .json for JSON, CSV otherwise "
+                                               "(default: <working file>_sweep.csv)")
+    parser.add_argument("--graph", help="sensitivity graph (default: <working file>_sweep.png), 'none' for no graph")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes, 0 for the number of cores (default: 1)")
+    parser.add_argument("--weighted", action="store_true", help="weight the isotherm fits by the R standard deviations")
+    parser.add_argument("--peak-finder", choices=["maximum", "smoothed"], default="maximum",
+                        help="programmatic peak: highest signal of run 1 or median peak of the smoothed runs "
+                             "(default: maximum)")
+    args = parser.parse_args(argv)
+
+    withoutExt = os.path.splitext(os.path.normpath(args.workingFile))[0]
+    output = args.output or "%s_sweep.csv" % withoutExt
+    graphPath = args.graph or "%s_sweep.png" % withoutExt
+
+    try:
+        data = loadSweepData(args.workingFile, args.peak_finder)
+    except PractisedError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    widths = parseValues(args.widths)
+    peakConcs = data['values'] if args.peak_concs == "all" else parseValues(args.peak_concs)
+    if data['peak det'] == "P":
+        unknown = [value for value in peakConcs if value not in data['peak times']]
+        if len(unknown) > 0:
+            parser.error("no concentration %s in %s" % (", ".join("%g" % value for value in unknown), args.workingFile))
+    elif args.peak_concs != "all":
+        print("Peaks are determined manually, only the window width is swept", file=sys.stderr)
+
+    results = sweep(data, widths, peakConcs, args.jobs or None, args.weighted)
+    reference = sweepPoint(data, data['window width'], data['peak conc'], args.weighted)
+
+    writeSweep(results, output)
+    print("Sensitivity table of %d points written to %s" % (len(results), output))
+    if graphPath != "none":
+        renderGraph(sensitivityGraph(results, reference, graphPath))
+        print("Sensitivity graph written to %s" % graphPath)
+
+    if reference["status"] == "ok":
+        print("Working file inputs: Kd = %.4f ± %.4f %s" % (reference["Kd"], reference["Kd error"], reference["unit"]))
+    summary = robustness(results, reference)
+    print("Fitted: %d of %d points" % (summary["ok"], summary["points"]))
+    if summary["ok"] > 0:
+        print("Kd: %.4f to %.4f %s (median %.4f, spread %.1f %% of the median)"
+              % (summary["Kd min"], summary["Kd max"], data['unit'], summary["Kd median"],
+                 summary["relative spread (%)"]))
+    if "within reference error (%)" in summary:
+        print("Within the error of the working file's Kd: %.1f %% of the points" % summary["within reference error (%)"])
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,44 +19,115 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+# Reads an .asc/.txt file with a single read and returns its preamble (rows split by the delimiter), all lines and
+# the delimiter of the numeric body. The preamble is every line up to the first one starting with a number. The
+# delimiters are tried in order; a preamble longer than 20 lines means the next one is tried (e.g. tab-delimited
+# files first, then space-delimited). A space delimiter is returned as "\s+" for pd.read_csv
+def readAscii(filePath, delimiters=("\t", " ")):
+    from practised_scan import isfloat
+
+    with open(filePath, "r", encoding="latin-1") as asciiFile:
+        lines = asciiFile.read().splitlines()
+
+    for delim in delimiters:
+        preamble = []
+        for line in lines:
+            row = line.split(delim)
+            if row[0].isalpha() == True or isfloat(row[0])==False:
+                preamble.append(row)
+            else:
+                break
+
+        if len(preamble) <= 20:
+            break
+
+    if delim == " ":
+        delim = "\s+"
+
+    return preamble, lines, delim
+
+
+# Reads one raw data file (.dat, .asc or .txt) and returns concentration, prefix, run number, the run as a data
+# frame ('raw time' and 'Experiment #' columns) and the sampling rate. Files with a signal multiplier have no time
+# column; their 'raw time' is rebuilt from the sampling rate when the concentration is assembled. Module level so
+# that it can run in a worker process
+def readRunFile(inputPath, file, useCache=True):
+    import io
+    import pandas as pd
+
+    from practised_knuteon import readTrace
+    from practised_cache import readTraceCached
+    from practised_scan import parseRunName
+
+    # Extract concentration, prefix and run number from file name (see naming conventions)
+    conc, prefix, runNumber = parseRunName(file)
+    hz = None
+
+    # Extract trace from .dat files using modified knuteon code (decoded traces are cached on disk)
+    if file.endswith(".dat"):
+        if useCache:
+            run = readTraceCached("%s/%s" % (inputPath, file))
+        else:
+            run = readTrace("%s/%s" % (inputPath, file))
+        run.columns = ["raw time", "Experiment " + str(runNumber)]
+
+    # Read .asc or .txt files once; preamble and numeric body are split in memory
+    elif file.endswith((".txt", ".asc")):
+        preamble, lines, delim = readAscii("%s/%s" % (inputPath, file))
+
+        # If no multiplier extract time and signal
+        if len(preamble) <= 1:
+            run = pd.read_csv(io.StringIO("\n".join(lines)), sep= delim, keep_default_na=True, na_values=str(0))
+            run = run.dropna(how="all")
+            run = run.fillna(0)
+            run = run.iloc[:,[0,1]]
+            run.columns = ["raw time", "Experiment " + str(runNumber)]
+            if '(s)' not in preamble[0]:
+                run.iloc[:,0] = run.iloc[:,0].mul(60)
+
+        # If multiplier needed extract signals, signal multipler and sampling rate
+        elif len(preamble) > 1:
+            signalMult_line = list(filter(lambda x: "Y Axis Multiplier:" in x[0], preamble))
+            signalMult = float(signalMult_line[0][1])
+
+            run = pd.read_csv(io.StringIO("\n".join(lines[len(preamble):])), sep="\t", header=None, keep_default_na=True, na_values=str(0))
+            run = run.dropna(how="all")
+            run = run.fillna(0)
+            run.columns = ["Experiment " + str(runNumber)]
+            run.loc[:"Experiment " + str(runNumber)] *= signalMult
+
+            hz_line = list(filter(lambda x: "Sampling Rate:" in x[0], preamble))
+            hz = float(hz_line[0][1])
+
+    return conc, prefix, runNumber, run, hz
+
+
+# A workingFilePath ending in .practised writes a binary working store instead of an Excel working file. workers is
+# the number of processes used to read the raw data files; 1 reads them one after another in this process, None uses
+# all cores. manifest is the directory manifest of validateDirectoryContents (practised_scan.scanDirectory); with it
+# the run files are taken from the manifest instead of listing the directory again, and the largest files are given
+# to the worker processes first
 def workingfileprep(inputPath, workingFilePath, propFlow, injectFlow, injectTime, sepLength, sepDiam,
                     injectLength, injectDiam, proteinName, ligandName, ligandConc,
-                    dataType, compYN, normalConc, windowWidth, peakDet, manualPeaks, peakConc):
+                    dataType, compYN, normalConc, windowWidth, peakDet, manualPeaks, peakConc, useCache=True,
+                    workers=1, manifest=None):
 
     
     ## Part 1 - Importing the required libraries and sub-libraries required below
-    import argparse                                   
-    import pathlib
-    import sys
     import pandas as pd
-    import matplotlib.pyplot as plt
     import numpy as np
-    from openpyxl import load_workbook
-    from openpyxl import Workbook
-    from openpyxl.utils import FORMULAE
-    from openpyxl.utils import get_column_letter, column_index_from_string
-    import math
-    from scipy.optimize import curve_fit
 
+    import io
     import os
-    from csv import reader
+    from concurrent.futures import ProcessPoolExecutor
     from natsort import natsorted
-    from datetime import date
 
-    from practised_knuteon import readTrace, variant_to_system_time, read_traces, extract_trace
-    import practised_pwexplode
+    from practised_store import newWorkingData
     
 
     d = {}
-    timeRun = {}
     prefix=""
-
-    def isfloat(num):
-        try:
-            float(num)
-            return True
-        except ValueError:
-            return False     
+    runFiles = []
 
     ### Reading in files from directory ###
     for file in os.listdir(inputPath):
@@ -64,20 +135,9 @@ def workingfileprep(inputPath, workingFilePath, propFlow, injectFlow, injectTime
         ## Read in simulated protein profile if compensation procedure was selected
         if compYN == "Y" and file.endswith((".txt")) and file.startswith('simulated'):
 
-             # Extract the preamble information
-             preamble = []
-             with open("%s/%s" %(inputPath, file), "r", encoding="latin-1") as fileCheck:
-                 csv_reader = reader(fileCheck, delimiter=" ")
-         
-                 for row in csv_reader:
-                     if row[0].isalpha() == True or isfloat(row[0])==False:
-                         preamble.append(row)
-                           
-                     elif row[0].isalpha() == False or isfloat(row[0])==True:
-                         break
-
-             # Read in simulated protein profile if compensation procedure was selected
-             simulated = pd.read_csv("%s/%s" % (inputPath,file), sep="\s+", encoding="latin-1", skiprows=len(preamble), header=None, keep_default_na=True, na_values=str(0))
+             # Read file once, preamble (space-delimited) and signals
+             preamble, lines, delim = readAscii("%s/%s" % (inputPath, file), delimiters=(" ",))
+             simulated = pd.read_csv(io.StringIO("\n".join(lines[len(preamble):])), sep="\s+", header=None, keep_default_na=True, na_values=str(0))
              simulated = simulated.fillna(0)
              simulated.columns = ['raw time', 'signal']
 
@@ -86,127 +146,51 @@ def workingfileprep(inputPath, workingFilePath, propFlow, injectFlow, injectTime
              simulated['signal'] = simulated['signal'].div(maxSim)
 
 
-        ## Read in raw data files 
-        if file.endswith((".txt", ".asc", ".dat")) and not file.startswith('simulated') and not 'READ' in os.path.splitext(file)[0]:
-
-            # Extract concentration prefix
-            molar = file.find("M")
-            prefix = file[molar-1]
-
-            # Extract concentration and run number from file name (see naming conventions)
-            conc = float(file.partition(prefix)[0])
-
-            name = os.path.splitext(file)[0]
-            if name[-1].isdigit()==True: 
-                 if name[-2:].isdigit()==True: 
-                    runNumber= int(name[-2:])
-                 else:
-                    runNumber= int(name[-1])
-            else:
-                runNumber=1
-
-
-            # Extract trace from .dat files using modified knuteon code
-            if file.endswith(".dat"):
-                run = readTrace("%s/%s" % (inputPath, file))
-                run.columns = ["raw time", "Experiment " + str(runNumber)]
-                
-                if conc in d:
-                    d[conc].insert(len(d[conc].columns), "Experiment " + str(runNumber), run["Experiment " + str(runNumber)])
-
-                    if runNumber < timeRun[conc]:
-                            d[conc].loc[:,'raw time'] = run.iloc[:,0]
-                            timeRun[conc] = runNumber
-
-                elif conc not in d:
-                    d[conc]=run
-                    timeRun[conc] = runNumber
-                
-            # Extract the preamble information from .asc or .txt files
-            elif file.endswith((".txt", ".asc")):
-                preamble = []
-                delim = "\t"
-                with open("%s/%s" %(inputPath, file), "r", encoding="latin-1") as fileCheck:
-                    csv_reader = reader(fileCheck, delimiter= delim)
-                    for row in csv_reader:
-                           
-                        if row[0].isalpha() == True or isfloat(row[0])==False:
-                            preamble.append(row)
-                            
-                        elif row[0].isalpha() == False or isfloat(row[0])==True:
-                            break
-                        
-                if len(preamble) > 20:
-                    preamble = []
-                    delim = "\s+"
-                    with open("%s/%s" %(inputPath, file), "r", encoding="latin-1") as fileCheck:
-                        csv_reader = reader(fileCheck, delimiter=" ")
-                        for row in csv_reader:
-                               
-                            if row[0].isalpha() == True or isfloat(row[0])==False:
-                                preamble.append(row)
-                                
-                            elif row[0].isalpha() == False or isfloat(row[0])==True:
-                                break
-                    
-                # If no multiplier extract time and signal
-                if len(preamble) <= 1:
-                    run = pd.read_csv("%s/%s" % (inputPath,file), sep= delim, encoding="latin-1", keep_default_na=True, na_values=str(0))
-                    run = run.dropna(how="all")
-                    run = run.fillna(0)
-                    run = run.iloc[:,[0,1]]
-                    run.columns = ["raw time", "Experiment " + str(runNumber)]
-                    if '(s)' not in preamble[0]:
-                        run.iloc[:,0] = run.iloc[:,0].mul(60)
-
-
-                    # Create or add experiment to dataframe if it exists
-                    if conc in d:
-                        d[conc].insert(len(d[conc].columns), "Experiment " + str(runNumber), run["Experiment " + str(runNumber)])
-
-                        if runNumber < timeRun[conc]:
-                            d[conc].loc[:,'raw time'] = run.iloc[:,0]
-                            timeRun[conc] = runNumber
-                            
-                    elif conc not in d:
-                        d[conc]=run
-                        timeRun[conc] = runNumber
-
-                # If multiplier needed extract signals, signal multipler, and iterate over signals
-                elif len(preamble) > 1:
-                    signalMult_line = list(filter(lambda x: "Y Axis Multiplier:" in x[0], preamble))
-                    signalMult = float(signalMult_line[0][1])
-
-                    run = pd.read_csv("%s/%s" %(inputPath, file), sep="\t", encoding="latin-1", skiprows=len(preamble), header=None, keep_default_na=True, na_values=str(0))
-                    run = run.dropna(how="all")
-                    run = run.fillna(0)
-                    run.columns = ["Experiment " + str(runNumber)]
-                    run.loc[:"Experiment " + str(runNumber)] *= signalMult
-
-                    # Create or add experiment to dataframe if it exists
-                    if conc in d:
-                        d[conc].insert(len(d[conc].columns), "Experiment " + str(runNumber), run)
-
-                    elif conc not in d:
-                        # Reconstruct raw time from sampling rate
-                        hz_line = list(filter(lambda x: "Sampling Rate:" in x[0], preamble))
-                        hz = float(hz_line[0][1])
-                        second_Gap = 1/hz
-
-                        rawTime = [0]
-
-                        for x in range(0,len(run)-1):
-                            rawTime.append(rawTime[x]+second_Gap)
-
-                        run.insert(0, "raw time", rawTime)
-                        d[conc]=run
-
-                            
-    for xConc in d:
-        orderedExp = natsorted(list(d[xConc].columns))
-        orderedExp.remove("raw time")
-        orderedExp.insert(0,"raw time")
-        d[xConc] = d[xConc].reindex(columns = orderedExp)
+        ## Collect raw data files
+        if manifest is None and file.endswith((".txt", ".asc", ".dat")) and not file.startswith('simulated') and not 'READ' in os.path.splitext(file)[0]:
+            runFiles.append(file)
+
+    # Run files of the manifest (ordered by concentration and run number), largest first for the worker processes
+    if manifest is not None:
+        runFiles = [entry['file'] for entry in manifest]
+        if workers != 1:
+            points = dict((entry['file'], entry['points']) for entry in manifest)
+            runFiles = sorted(runFiles, key=lambda file: -points[file])
+
+    # Read raw data files, one after another or in parallel worker processes
+    if workers == 1:
+        runs = [readRunFile(inputPath, file, useCache) for file in runFiles]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            runs = list(pool.map(readRunFile, [inputPath]*len(runFiles), runFiles, [useCache]*len(runFiles)))
+
+    # Collect the runs of each concentration as arrays, ordered by run number so that the result does not depend on
+    # the order of files in the directory or of finished workers
+    concRuns = {}
+    for conc, prefix, runNumber, run, hz in sorted(runs, key=lambda x: (x[0], x[2])):
+        if conc not in concRuns:
+            concRuns[conc] = []
+        concRuns[conc].append((runNumber, run, hz))
+
+    # Assemble each concentration into one 2-D array (raw time + one column per run) and a single dataframe. The
+    # first (lowest) run provides the rows and the raw time, which is built from the sampling rate if the file had
+    # no time column. Other runs are aligned to its rows
+    for conc in concRuns:
+        firstRun, firstHz = concRuns[conc][0][1], concRuns[conc][0][2]
+        rows = firstRun.index
+
+        columns = np.empty((len(rows), len(concRuns[conc]) + 1))
+        if "raw time" in firstRun.columns:
+            columns[:,0] = firstRun["raw time"].to_numpy()
+        else:
+            columns[:,0] = np.arange(len(rows)) / firstHz
+
+        names = ["raw time"]
+        for col, (runNumber, run, hz) in enumerate(concRuns[conc], start=1):
+            names.append("Experiment " + str(runNumber))
+            columns[:,col] = run["Experiment " + str(runNumber)].reindex(rows).to_numpy()
+
+        d[conc] = pd.DataFrame(columns, columns=names)
 
             
     orderedDict = natsorted(d.keys())
@@ -214,12 +198,9 @@ def workingfileprep(inputPath, workingFilePath, propFlow, injectFlow, injectTime
     if prefix == "u":
         prefix = "µ"
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Inputs"
-
-    writer = pd.ExcelWriter(workingFilePath, engine = 'openpyxl')
-    writer.book = wb
+    # Working file (.xlsx) or working store (.practised), depending on the file path
+    workingData = newWorkingData(workingFilePath)
+    ws = workingData.book["Inputs"]
         
     # Generate Inputs Sheet
     inputDictionary = {"Propogation flow rate":propFlow, "Injection flow rate":injectFlow, "Injection time (s)":injectTime,
@@ -244,14 +225,12 @@ def workingfileprep(inputPath, workingFilePath, propFlow, injectFlow, injectTime
 
    # Add simulated protein profile if compensation required
     if compYN == "Y":
-        simulated.to_excel(writer, sheet_name = "P_simulated", index=False)
+        workingData.setSheet("P_simulated", simulated)
 
     # Add sheet for each concentration dataframe
     for y in orderedDict:
-        d[y].to_excel(writer, sheet_name = "%s %sM" % (y, prefix), index=False)
+        workingData.setSheet("%s %sM" % (y, prefix), d[y])
             
-    writer.save()
-    writer.close()
-    wb.save(workingFilePath)
+    workingData.save()
 
     return workingFilePath
@@ -0,0 +1,13 @@
+# Tests of prACTISed are run with pytest from the program directory:
+#     python -m pytest tests
+# The program modules are imported from the parent directory; modules
+# without .py extension (e.g. practised_compensation) are loaded by
+# practised_loader, as in practised.py and practised_batch.py
+
+import os
+import sys
+
+programDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, programDirectory)
+
+import practised_loader
@@ -0,0 +1,24 @@
+# Tests of practised_analysis.py on a copy of the shipped sample
+# idealinputs.xlsx
+
+import os
+import shutil
+
+from conftest import programDirectory
+from practised_analysis import dataanalysis
+from practised_store import openWorkingData, readOutputs
+
+
+def test_analysis_can_be_run_again(tmp_path):
+    sample = str(tmp_path / "idealinputs.xlsx")
+    shutil.copy(os.path.join(programDirectory, "idealinputs.xlsx"), sample)
+    sheetnames = openWorkingData(sample).sheetnames
+
+    for run in range(2):
+        graphs, results = dataanalysis(sample, returnResults=True, graphMode="off", resamples=0)
+        assert graphs is None
+
+    assert openWorkingData(sample).sheetnames == [name for name in sheetnames if name != "Outputs"] + ["Outputs"]
+    assert readOutputs(sample)['kd'][0][0] == "Kd: %.4f ± %.4f %s" % (results['Kd'], results['Kd error'],
+                                                                       results['unit'])
+    assert os.listdir(str(tmp_path)) == ["idealinputs.xlsx"]
@@ -0,0 +1,38 @@
+# Tests of practised_batch.py run as the README documents it, in a fresh
+# Python process (without the import setup of conftest.py)
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from conftest import programDirectory
+
+
+def runBatch(arguments, cwd):
+    environment = dict(os.environ)
+    environment.pop("PYTHONPATH", None)
+    return subprocess.run([sys.executable, os.path.join(programDirectory, "practised_batch.py")] + arguments,
+                          cwd=cwd, env=environment, capture_output=True, text=True)
+
+
+def test_batch_command_line_analyzes_working_files(tmp_path):
+    for name in ["idealinputs.xlsx", "idealinputs_compensation.xlsx"]:
+        shutil.copy(os.path.join(programDirectory, name), str(tmp_path / name))
+    (tmp_path / "broken.xlsx").write_text("")
+
+    result = runBatch(["*.xlsx", "-o", "summary.json", "-j", "1", "--graphs", "off", "--resamples", "0"],
+                      str(tmp_path))
+    assert "Traceback" not in result.stderr
+    assert "ModuleNotFoundError" not in result.stderr
+    assert result.returncode == 1  # broken.xlsx fails, the other datasets are still analyzed
+
+    with open(str(tmp_path / "summary.json"), encoding="utf-8") as summary:
+        results = dict((os.path.basename(row["dataset"]), row) for row in json.load(summary))
+    assert results["idealinputs.xlsx"]["status"] == "ok"
+    assert results["idealinputs.xlsx"]["Kd"] == pytest.approx(26.5957, rel=1e-4)
+    assert results["idealinputs_compensation.xlsx"]["status"] == "ok"
+    assert results["broken.xlsx"]["status"] == "failed"
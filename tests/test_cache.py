@@ -0,0 +1,46 @@
+# Tests of practised_cache.py: the cache is only an optimization, so
+# traces are still read if the cache directory cannot be used
+
+import datetime
+import errno
+import os
+import pathlib
+
+import numpy as np
+import pytest
+
+import practised_cache
+
+
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    dataFile = tmp_path / "1 uM_1.dat"
+    dataFile.write_bytes(b"Karat32 run")
+    header = {'runtime': datetime.datetime(2022, 5, 1, 12, 0), 'method path': pathlib.PureWindowsPath("C:\\method.met")}
+    decoded = (header, {'0': {'time': np.arange(3.0), 'signal': np.ones(3), 'header': {'detector': 'LIF'}}})
+    monkeypatch.setattr(practised_cache, "readTraces", lambda inputFile, traceids=None: decoded)
+    return str(dataFile), decoded
+
+
+def test_unwritable_cache_directory_is_skipped(tmp_path, traces):
+    dataFile, decoded = traces
+    blocked = tmp_path / "blocked"
+    blocked.write_text("not a directory")
+
+    assert practised_cache.readTracesCached(dataFile, ['0'], cacheDir=str(blocked / "cache")) is decoded
+    run = practised_cache.readTraceCached(dataFile, cacheDir=str(blocked / "cache"))
+    assert run[1].tolist() == [1.0, 1.0, 1.0]
+
+
+def test_full_cache_directory_leaves_no_temporary_file(tmp_path, traces, monkeypatch):
+    dataFile, decoded = traces
+    cacheDir = tmp_path / "cache"
+
+    def full(cacheFile, **arrays):
+        cacheFile.write(b"PK partial")
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(np, "savez", full)
+
+    header, result = practised_cache.readTracesCached(dataFile, ['0'], cacheDir=str(cacheDir))
+    assert result['0']['signal'].tolist() == [1.0, 1.0, 1.0]
+    assert os.listdir(str(cacheDir)) == []
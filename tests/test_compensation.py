@@ -0,0 +1,56 @@
+# Tests of practised_compensation on the shipped sample
+# idealinputs_compensation.xlsx (compensated and analyzed in a copy)
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import practised_cache
+from conftest import programDirectory
+from practised_compensation import compensate, profileTooShort
+from practised_notify import PractisedError
+from practised_store import openWorkingData
+
+
+@pytest.fixture
+def sample(tmp_path, monkeypatch):
+    monkeypatch.setattr(practised_cache, "cacheDirectory", str(tmp_path / "cache"))
+    path = str(tmp_path / "idealinputs_compensation.xlsx")
+    shutil.copy(os.path.join(programDirectory, "idealinputs_compensation.xlsx"), path)
+    return path
+
+
+def test_shipped_sample_compensates(sample):
+    from practised_analysis import dataanalysis
+
+    assert compensate(sample) is not False
+
+    workingData = openWorkingData(sample)
+    idealSheet = workingData.book["Inputs"]
+    assert idealSheet["B13"].value == "Compensated"
+    for x in range(1, int(idealSheet.cell(10,2).value) + 1):
+        signals = workingData.sheet(idealSheet.cell(x,5).value).dropna(how='all').iloc[:,1:].to_numpy(dtype=float)
+        assert np.all(np.isfinite(signals)) and np.all(signals >= 0)
+
+    graphs, results = dataanalysis(sample, returnResults=True, graphMode="off", resamples=0)
+    assert results['Kd'] == pytest.approx(5.0637, rel=1e-4)
+
+
+def test_profile_may_end_one_step_early():
+    profile = pd.Series(np.arange(1200) * 0.075 + 0.28)
+    assert not profileTooShort(profile, pd.Series([0.0, profile.iloc[-1]]))
+    assert not profileTooShort(profile, pd.Series([0.0, profile.iloc[-1] + 0.001]))
+    assert profileTooShort(profile, pd.Series([0.0, profile.iloc[-1] + 0.1]))
+
+
+def test_short_profile_is_rejected(sample):
+    workingData = openWorkingData(sample)
+    simulated = workingData.sheet("P_simulated")
+    workingData.setSheet("P_simulated", simulated[simulated['raw time'] < 60])
+    workingData.save()
+
+    with pytest.raises(PractisedError, match="does not extend as long"):
+        compensate(sample)
@@ -0,0 +1,19 @@
+# Tests of practised_scan.py
+
+from practised_scan import manifestArguments
+
+
+def test_manifest_is_only_passed_to_converters_that_take_it():
+    def template(inputPath, workingFilePath, peakDet, manualPeaks, peakConc):
+        pass
+
+    def current(inputPath, workingFilePath, peakDet, manualPeaks, peakConc, useCache=True, workers=1, manifest=None):
+        pass
+
+    def keywords(inputPath, workingFilePath, **kwargs):
+        pass
+
+    manifest = [{'file': '1 uM_1.asc'}]
+    assert manifestArguments(template, manifest) == {}
+    assert manifestArguments(current, manifest) == {'manifest': manifest}
+    assert manifestArguments(keywords, manifest) == {'manifest': manifest}
@@ -0,0 +1,89 @@
+# Tests of practised_startup.py: the startup check must run in the
+# program directory (including the modules without .py extension). The
+# window is measured with a stand-in PySimpleGUI, so that the tests do not
+# depend on a display or on PySimpleGUI being installed
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import practised_startup
+from conftest import programDirectory
+
+# Stand-in for PySimpleGUI: every element is accepted, the event loop is never reached
+standInGUI = ("class Window:\n"
+              "    def __init__(self, *args, **kwargs):\n"
+              "        pass\n"
+              "    def close(self):\n"
+              "        pass\n"
+              "    def read(self, *args, **kwargs):\n"
+              "        raise RuntimeError('event loop reached')\n"
+              "def __getattr__(name):\n"
+              "    return lambda *args, **kwargs: None\n")
+
+
+@pytest.fixture
+def standIn(tmp_path, monkeypatch):
+    (tmp_path / "PySimpleGUI.py").write_text(standInGUI)
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+    return tmp_path
+
+
+def runStartup(arguments):
+    return subprocess.run([sys.executable, os.path.join(programDirectory, "practised_startup.py"), "--repeat", "1"] +
+                          arguments, capture_output=True, text=True)
+
+
+def test_core_modules_import_without_heavy_modules(tmp_path):
+    # Fresh interpreter outside the program directory, without the import setup of conftest.py
+    code = ("import sys\n"
+            "sys.path.insert(0, %r)\n"
+            "import practised_loader\n"
+            "import %s\n"
+            "print(' '.join(name for name in ['pandas', 'scipy', 'matplotlib', 'fpdf', 'openpyxl', 'PySimpleGUI'] "
+            "if name in sys.modules))\n"
+            % (programDirectory, ", ".join(practised_startup.coreModules)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=str(tmp_path), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+    elapsed, loaded = practised_startup.measureCore()
+    assert loaded == []
+
+
+def test_window_is_measured(standIn):
+    elapsed, reason = practised_startup.measureWindow()
+    assert reason is None
+    assert elapsed > 0
+
+
+def test_window_failure_is_reported(standIn):
+    (standIn / "PySimpleGUI.py").write_text(standInGUI + "def theme(*args, **kwargs):\n    raise OSError('no display')\n")
+    elapsed, reason = practised_startup.measureWindow()
+    assert elapsed is None
+    assert reason == "OSError: no display"
+
+
+def test_budgets_are_enforced(standIn):
+    result = runStartup(["--core-budget", "0", "--window-budget", "60"])
+    assert "Traceback" not in result.stderr
+    assert result.stdout.startswith("Core import: ")
+    assert "Time to window: " in result.stdout and "skipped" not in result.stdout
+    assert result.returncode == 1
+
+    result = runStartup(["--core-budget", "60", "--window-budget", "0"])
+    assert "skipped" not in result.stdout
+    assert result.returncode == 1
+
+    result = runStartup(["--core-budget", "60", "--window-budget", "60"])
+    assert "Core import loads" not in result.stdout
+    assert result.returncode == 0
+
+
+def test_core_import_failure_is_reported(monkeypatch):
+    monkeypatch.setattr(practised_startup, "coreModules", ["practised_missing"])
+    with pytest.raises(RuntimeError, match="practised_missing"):
+        practised_startup.measureCore()
+    assert practised_startup.main(["--repeat", "1"]) == 1
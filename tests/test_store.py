@@ -0,0 +1,165 @@
+# Tests of practised_store.py on copies of the shipped sample idealinputs.xlsx
+
+import io
+import os
+import re
+import shutil
+import zipfile
+
+import pytest
+
+import practised_store
+from conftest import programDirectory
+from practised_store import mergeStyles, openWorkingData
+
+
+@pytest.fixture
+def sample(tmp_path):
+    path = str(tmp_path / "idealinputs.xlsx")
+    shutil.copy(os.path.join(programDirectory, "idealinputs.xlsx"), path)
+    return path
+
+
+def test_copied_sheet_keeps_conditional_formatting(sample):
+    from openpyxl import load_workbook
+    from openpyxl.formatting.rule import CellIsRule
+    from openpyxl.styles import Font, PatternFill
+
+    wb = load_workbook(sample)
+    names = wb.sheetnames
+    wb[names[2]].conditional_formatting.add('B2:B50', CellIsRule(operator='greaterThan', formula=['1'],
+                                                                 fill=PatternFill(bgColor='FFC7CE', fill_type='solid')))
+    wb[names[2]].conditional_formatting.add('C2:C50', CellIsRule(operator='lessThan', formula=['0.5'],
+                                                                 font=Font(color='9C0006')))
+    wb.save(sample)
+
+    workingData = openWorkingData(sample)
+    workingData.setSheet(names[3], workingData.sheet(names[3]) * 2)
+    workingData.save()
+
+    rules = dict((str(formatting.sqref), formatting.rules[0]) for formatting in
+                 load_workbook(sample)[names[2]].conditional_formatting)
+    assert rules['B2:B50'].dxf.fill.bgColor.rgb == '00FFC7CE'
+    assert rules['C2:C50'].dxf.font.color.rgb == '009C0006'
+
+
+def test_styled_cells_survive_a_save(sample):
+    from openpyxl import load_workbook
+    from openpyxl.styles import Font
+    from openpyxl.worksheet.datavalidation import DataValidation
+
+    wb = load_workbook(sample)
+    names = wb.sheetnames
+    inputs = wb["Inputs"]
+    inputs["B3"].number_format = "0.000"
+    inputs["B3"].font = Font(italic=True, color="FF0000")
+    inputs.column_dimensions["A"].width = 41
+    validation = DataValidation(type="list", formula1='"Y,N"')
+    inputs.add_data_validation(validation)
+    validation.add("B13")
+    wb.save(sample)
+
+    for run in range(3):
+        workingData = openWorkingData(sample)
+        workingData.setSheet(names[3], workingData.sheet(names[3]) * 2)
+        workingData.book["Inputs"].cell(1, 3).value = "run %d" % run
+        workingData.save()
+        with zipfile.ZipFile(sample) as archive:
+            if run == 0:
+                size = len(archive.read("xl/styles.xml"))
+            assert len(archive.read("xl/styles.xml")) == size
+
+    wb = load_workbook(sample)
+    inputs = wb["Inputs"]
+    assert inputs["C1"].value == "run 2"
+    assert inputs["B3"].number_format == "0.000"
+    assert inputs["B3"].font.i and inputs["B3"].font.color.rgb == "00FF0000"
+    assert inputs.column_dimensions["A"].width == 41
+    assert [str(validation.sqref) for validation in inputs.data_validations.dataValidation] == ["B13"]
+
+    # Header style of a copied data sheet
+    assert wb[names[1]]["A1"].font.b and wb[names[1]]["A1"].border.left.style == "thin"
+
+
+def test_styles_are_appended_to_the_source_styles():
+    styles = (b'<styleSheet><numFmts count="1"><numFmt numFmtId="164" formatCode="0.0"/></numFmts>'
+              b'<fonts count="2"><font/><font><b/></font></fonts><fills count="1"><fill/></fills>'
+              b'<borders count="1"><border/></borders><cellStyleXfs count="1"><xf fontId="0"/></cellStyleXfs>'
+              b'<cellXfs count="2"><xf numFmtId="0" fontId="0" xfId="0"/><xf numFmtId="164" fontId="1" xfId="0"/>'
+              b'</cellXfs><dxfs count="1"><dxf><font><i/></font></dxf></dxfs></styleSheet>')
+    source = (b'<styleSheet xmlns:x14ac="ac"><numFmts count="1"><numFmt numFmtId="164" formatCode="0.000"/></numFmts>'
+              b'<fonts count="2" x14ac:knownFonts="1"><font><u/></font><font><b/></font></fonts>'
+              b'<fills count="1"><fill/></fills><borders count="1"><border/></borders>'
+              b'<cellStyleXfs count="1"><xf fontId="0"/></cellStyleXfs>'
+              b'<cellXfs count="1"><xf numFmtId="0" fontId="0" xfId="0"/></cellXfs><dxfs count="0"/></styleSheet>')
+
+    merged, cellFormats, differentialFormats = mergeStyles(styles, source)
+    assert b'<numFmts count="2"><numFmt numFmtId="164" formatCode="0.000"/><numFmt numFmtId="165" formatCode="0.0"/>' \
+        in merged
+    assert b'<fonts count="3" x14ac:knownFonts="1"><font><u/></font><font><b/></font><font/></fonts>' in merged
+    assert b'<cellStyleXfs count="2"><xf fontId="0"/><xf fontId="2"/></cellStyleXfs>' in merged
+    assert b'<cellXfs count="3"><xf numFmtId="0" fontId="0" xfId="0"/><xf numFmtId="0" fontId="2" xfId="1"/>' \
+        b'<xf numFmtId="165" fontId="1" xfId="1"/></cellXfs>' in merged
+    assert cellFormats == [1, 2] and differentialFormats == [0]
+
+    xml = b'<cols><col min="1" style="1"/></cols><row r="1" s="0"><c r="A1" s="1"/></row><cfRule dxfId="0"/>'
+    assert practised_store.restyleCells(xml, cellFormats, differentialFormats) == \
+        b'<cols><col min="1" style="2"/></cols><row r="1" s="1"><c r="A1" s="2"/></row><cfRule dxfId="0"/>'
+
+    assert mergeStyles(styles, b'<x:styleSheet><x:dxfs count="1"><x:dxf/></x:dxfs></x:styleSheet>') is None
+
+
+def test_failed_save_leaves_no_temporary_files(sample, monkeypatch):
+    workingData = openWorkingData(sample)
+    name = workingData.sheetnames[2]
+    workingData.setSheet(name, workingData.sheet(name) * 2)
+
+    def fail(target, df, chunk=10000):
+        raise OSError("disk full")
+    monkeypatch.setattr(practised_store, "writeSheetXML", fail)
+
+    with pytest.raises(OSError):
+        workingData.save()
+    assert os.listdir(os.path.dirname(sample)) == ["idealinputs.xlsx"]
+
+
+def test_sheet_with_namespace_prefix_is_read(sample):
+    expected = openWorkingData(sample).sheet("1.0 µM")
+
+    prefixed = sample + ".prefixed.xlsx"
+    with zipfile.ZipFile(sample) as source, zipfile.ZipFile(prefixed, "w") as target:
+        part = practised_store.sheetParts(source)["1.0 µM"]
+        for member in source.infolist():
+            xml = source.read(member.filename)
+            if member.filename == part:
+                xml = re.sub(rb'<(/?)(\w+)\b', rb'<\1x:\2', xml.replace(b'xmlns="', b'xmlns:x="'))
+                assert b"<x:c " in xml
+            target.writestr(member, xml)
+
+    sheet = openWorkingData(prefixed).sheet("1.0 µM")
+    assert list(sheet.columns) == list(expected.columns)
+    assert sheet.shape == expected.shape and sheet.shape[0] > 0
+    assert (sheet.to_numpy(dtype=float) == expected.to_numpy(dtype=float)).all()
+
+
+def test_array_is_sized_from_cells_not_dimension():
+    xml = (b'<worksheet><dimension ref="A1:XFD1048576"/><sheetData><row r="1"><c r="A1"><v>1</v></c></row>'
+           b'<row r="2"><c r="A2"><v>2.5</v></c></row></sheetData></worksheet>')
+    header, values = practised_store.readSheetPart(io.BytesIO(xml), [])
+    assert header == [1]
+    assert values.tolist() == [[2.5]]
+    assert values.base is None or values.base.size < 16
+    assert practised_store.readSheetPart(io.BytesIO(b'<worksheet><sheetData/></worksheet>'), []) is None
+
+
+def test_references_past_the_styles_of_openpyxl_are_kept_valid():
+    # openpyxl keeps xfId="1" of a cell format it read, but writes a single cell style format
+    styles = (b'<styleSheet><fonts count="1"><font/></fonts><cellStyleXfs count="1"><xf fontId="0"/></cellStyleXfs>'
+              b'<cellXfs count="1"><xf fontId="0" xfId="1"/></cellXfs></styleSheet>')
+    source = (b'<styleSheet><fonts count="1"><font><b/></font></fonts>'
+              b'<cellStyleXfs count="1"><xf fontId="0"/></cellStyleXfs><cellXfs count="1"><xf fontId="0" xfId="0"/>'
+              b'</cellXfs></styleSheet>')
+
+    merged, cellFormats, differentialFormats = mergeStyles(styles, source)
+    assert b'<cellXfs count="2"><xf fontId="0" xfId="0"/><xf fontId="1" xfId="1"/></cellXfs>' in merged
+    assert cellFormats == [1]